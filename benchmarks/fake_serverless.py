@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A stand-in for the serverless CLI, that prints output shaped like
+serverless v3 without calling a provider.
+
+It is tuned with environment variables:
+    FAKE_SERVERLESS_LATENCY: seconds to sleep in every command.
+    FAKE_SERVERLESS_OUTPUT_BYTES: bytes of progress output to print to
+        stderr in every command.
+    FAKE_SERVERLESS_COUNTER: a file to append the subcommand of every
+        call to.
+"""
+
+import os
+import re
+import sys
+import time
+
+FUNCTION = re.compile(r'^- ([\w-]+):\s*$')
+PROGRESS_LINE = 'Packaging and uploading the service artifacts ' \
+                '(the fake serverless CLI is not calling a provider)\n'
+
+
+def option(args, name, default=None):
+    if name in args and args.index(name) + 1 < len(args):
+        return args[args.index(name) + 1]
+    return default
+
+
+def service_functions(cwd):
+    """The function names of the serverless.yml in cwd, in order."""
+    try:
+        with open(os.path.join(cwd, 'serverless.yml')) as config_file:
+            lines = config_file.read().splitlines()
+    except (IOError, OSError):
+        return []
+    names = []
+    in_functions = False
+    for line in lines:
+        if line.startswith('functions:'):
+            in_functions = True
+            continue
+        if in_functions:
+            if line and not line[0].isspace() and not line.startswith('-'):
+                break
+            match = FUNCTION.match(line)
+            if match:
+                names.append(match.group(1))
+    return names
+
+
+def progress(output_bytes):
+    if output_bytes <= 0:
+        return
+    lines = PROGRESS_LINE * (output_bytes // len(PROGRESS_LINE) + 1)
+    sys.stderr.write(lines[:output_bytes])
+    sys.stderr.flush()
+
+
+def service_information(args, functions):
+    service = 'benchmark'
+    stage = option(args, '--stage', 'dev')
+    region = option(args, '--region', 'us-east-1')
+    lines = [
+        'service: {}'.format(service),
+        'stage: {}'.format(stage),
+        'region: {}'.format(region),
+        'stack: {}-{}'.format(service, stage),
+    ]
+    if functions:
+        lines.append('functions:')
+        lines.extend('  {0}: {1}-{2}-{0}'.format(name, service, stage)
+                     for name in functions)
+    return '\n'.join(lines) + '\n'
+
+
+def deploy(args, functions):
+    if 'function' in args:
+        return 'Function code deployed ({}) (0.1s)\n'.format(
+            option(args, '--function'))
+    stage = option(args, '--stage', 'dev')
+    region = option(args, '--region', 'us-east-1')
+    return (
+        'Deploying benchmark to stage {0} ({1})\n\n'
+        'Service deployed to stack benchmark-{0} (1s)\n\n'.format(
+            stage, region) +
+        '\n'.join(service_information(args, functions).splitlines()[4:]) +
+        '\n')
+
+
+def metrics(args):
+    end = time.localtime()
+    start = time.localtime(time.mktime(end) - 24 * 60 * 60)
+    window = '{} - {}'.format(
+        time.strftime('%B %d, %Y %I:%M %p', start),
+        time.strftime('%B %d, %Y %I:%M %p', end))
+    return (
+        '{}\n{}\n\n'
+        'Invocations: 12\n'
+        'Throttles: 0\n'
+        'Errors: 1\n'
+        'Duration (avg.): 34.3ms\n'.format(
+            option(args, '--function', 'Service wide'), window))
+
+
+def package(args):
+    path = option(args, '--package', '.serverless')
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'benchmark.zip'), 'wb') as artifact:
+        artifact.write(b'\0' * 1024)
+    return 'Packaging benchmark for stage dev (us-east-1)\n'
+
+
+def main(args):
+    command = args[0] if args else ''
+    counter = os.environ.get('FAKE_SERVERLESS_COUNTER')
+    if counter:
+        with open(counter, 'a') as counter_file:
+            counter_file.write(command + '\n')
+    time.sleep(float(os.environ.get('FAKE_SERVERLESS_LATENCY') or 0))
+    progress(int(os.environ.get('FAKE_SERVERLESS_OUTPUT_BYTES') or 0))
+    if command == 'deploy':
+        output = deploy(args, service_functions(os.getcwd()))
+    elif command == 'info':
+        output = service_information(args, service_functions(os.getcwd()))
+    elif command == 'metrics':
+        output = metrics(args)
+    elif command == 'package':
+        output = package(args)
+    elif command == 'invoke':
+        output = '{{"statusCode": 200, "function": "{}"}}\n'.format(
+            option(args, '--function'))
+    else:
+        output = '{} (0.1s)\n'.format(' '.join(args))
+    sys.stdout.write(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
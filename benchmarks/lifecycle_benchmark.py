@@ -0,0 +1,412 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Time initialize_serverless, the Serverless methods and the lifecycle of
+the plugin tasks against benchmarks/fake_serverless.py, and compare the
+wall time, subprocess count and peak RSS of every operation with stored
+baselines.
+
+    python benchmarks/lifecycle_benchmark.py [--functions 1,10,100,1000,2000]
+        [--latency 0.05] [--output-bytes 4096] [--max-concurrency 10]
+        [--baseline benchmarks/baseline.json]
+        [--local-baseline benchmarks/.local-baseline.json]
+        [--tolerance 0.25] [--save-baseline]
+
+The subprocess counts do not depend on the host, so they are kept in the
+baseline that is committed. Wall times and peak RSS are only compared with
+a local baseline, that --save-baseline writes on the host that runs the
+comparison.
+
+Every number of functions is measured in a process of its own, so that the
+peak RSS of one does not hide the next. The exit code is 1 if an operation
+regressed.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import resource
+import argparse
+import tempfile
+import subprocess
+from functools import partial
+
+import mock
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIRECTORY))
+
+from cloudify.state import current_ctx  # noqa: E402
+
+from serverless_plugin import tasks, utils  # noqa: E402
+
+FAKE_SERVERLESS = os.path.join(BENCHMARKS_DIRECTORY, 'fake_serverless.py')
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIRECTORY, 'baseline.json')
+DEFAULT_LOCAL_BASELINE = os.path.join(
+    BENCHMARKS_DIRECTORY, '.local-baseline.json')
+DEFAULT_FUNCTIONS = [1, 10, 100, 1000, 2000]
+DEFAULT_LATENCY = 0.05
+DEFAULT_OUTPUT_BYTES = 4096
+DEFAULT_MAX_CONCURRENCY = 10
+DEFAULT_TOLERANCE = 0.25
+# Differences in wall time below this many seconds are noise.
+MIN_WALL_DELTA = 0.1
+HANDLERS = 10
+HANDLER_SOURCE = 'def handle(event, context):\n    return {}\n'
+LIFECYCLE = [
+    ('create', tasks.create, {}),
+    ('configure', tasks.configure, {}),
+    ('start', tasks.start, {}),
+    ('start (unchanged)', tasks.start, {}),
+    ('poststart', tasks.poststart, {}),
+    ('info', tasks.info, {'refresh': True}),
+    ('invoke', tasks.invoke, {}),
+    ('metrics', tasks.metrics, {}),
+    ('stop', tasks.stop, {}),
+    ('delete', tasks.delete, {}),
+]
+
+
+def synthetic_resource_config(functions):
+    return {
+        'name': 'benchmark',
+        'functions': [
+            {
+                'name': 'function_{}'.format(index),
+                'handler': 'handler_{}.handle'.format(index % HANDLERS),
+                'path': 'handlers/handler_{}.py'.format(index % HANDLERS),
+                'events': [
+                    {
+                        'http': {
+                            'path': 'function/{}'.format(index),
+                            'method': 'get',
+                        }
+                    }
+                ],
+            }
+            for index in range(functions)
+        ]
+    }
+
+
+def benchmark_ctx(work_directory, name, functions):
+    root_directory = os.path.join(work_directory, name)
+    os.makedirs(root_directory)
+    # The records are still made, as they would be for the manager, but
+    # not printed.
+    logger = logging.getLogger('benchmark.{}'.format(name))
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    def download_resource(source, target):
+        with open(target, 'w') as handler:
+            handler.write(HANDLER_SOURCE)
+
+    return mock.Mock(
+        node=mock.Mock(
+            id=name,
+            properties={
+                'use_external_resource': False,
+                'client_config': {
+                    'provider': 'aws',
+                    'credentials': {
+                        'key': 'benchmark',
+                        'secret': 'benchmark',
+                    }
+                },
+                'serverless_config': {
+                    'executable_path': FAKE_SERVERLESS,
+                    'scratch_directory': os.path.join(
+                        work_directory, 'scratch-{}'.format(name)),
+                    'binary_lock_directory': os.path.join(
+                        work_directory, 'locks'),
+                },
+                'resource_config': synthetic_resource_config(functions),
+            },
+            type_hierarchy=[
+                'cloudify.nodes.Root',
+                'cloudify.nodes.serverless.Service'
+            ]),
+        instance=mock.Mock(
+            id='{}_012345'.format(name),
+            runtime_properties={utils.ROOT_DIR: root_directory},
+            relationships=[]),
+        deployment=mock.Mock(id='benchmark'),
+        blueprint=mock.Mock(id='benchmark'),
+        operation=mock.Mock(retry_number=0),
+        workflow_id='install',
+        logger=logger,
+        download_resource=download_resource)
+
+
+def stored_property(_ctx, property_name, *_, **__):
+    return _ctx.node.properties.get(property_name)
+
+
+def subprocess_count(counter_path):
+    try:
+        with open(counter_path) as counter_file:
+            return sum(1 for _ in counter_file)
+    except (IOError, OSError):
+        return 0
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_scale(functions,
+              latency=DEFAULT_LATENCY,
+              output_bytes=DEFAULT_OUTPUT_BYTES,
+              max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """Measure every operation for a service of functions functions.
+
+    :return: a dict of {'operations': {name: measurements}} and the peak
+        RSS of the process.
+    """
+    work_directory = tempfile.mkdtemp(prefix='serverless-benchmark-')
+    counter_path = os.path.join(work_directory, 'calls')
+    os.environ.update({
+        'FAKE_SERVERLESS_LATENCY': str(latency),
+        'FAKE_SERVERLESS_OUTPUT_BYTES': str(output_bytes),
+        'FAKE_SERVERLESS_COUNTER': counter_path,
+    })
+    operations = {}
+
+    def measure(name, func):
+        calls = subprocess_count(counter_path)
+        start = time.perf_counter()
+        result = func()
+        operations[name] = {
+            'wall': round(time.perf_counter() - start, 4),
+            'subprocesses': subprocess_count(counter_path) - calls,
+            # ru_maxrss is a high water mark, so this is the peak RSS of
+            # the process up to the end of the operation.
+            'peak_rss_kb': peak_rss_kb(),
+        }
+        return result
+
+    try:
+        with mock.patch('serverless_plugin.utils.get_stored_property',
+                        side_effect=stored_property):
+            ctx = benchmark_ctx(work_directory, 'sdk', functions)
+            current_ctx.set(ctx=ctx)
+            serverless = measure(
+                'initialize_serverless',
+                partial(utils.initialize_serverless, ctx))
+            measure('Serverless.configure', serverless.configure)
+            measure('Serverless.execute', partial(
+                serverless.execute,
+                serverless._command(['print']),
+                return_output=True))
+            measure('Serverless.info', serverless.info)
+            ctx = benchmark_ctx(work_directory, 'lifecycle', functions)
+            current_ctx.set(ctx=ctx)
+            for name, task, kwargs in LIFECYCLE:
+                measure('tasks.{}'.format(name), partial(
+                    task,
+                    ctx=ctx,
+                    max_concurrency=max_concurrency,
+                    **kwargs))
+    finally:
+        current_ctx.clear()
+        shutil.rmtree(work_directory, ignore_errors=True)
+    return {
+        'operations': operations,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def run_scale_in_process(functions, latency, output_bytes, max_concurrency):
+    output = subprocess.check_output([
+        sys.executable,
+        os.path.abspath(__file__),
+        '--scale', str(functions),
+        '--latency', str(latency),
+        '--output-bytes', str(output_bytes),
+        '--max-concurrency', str(max_concurrency),
+    ])
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def subprocess_counts(results):
+    """The measurements of results that do not depend on the host."""
+    return {
+        'scales': {
+            functions: {
+                'operations': {
+                    name: {'subprocesses': measured['subprocesses']}
+                    for name, measured in scale['operations'].items()
+                },
+            }
+            for functions, scale in results['scales'].items()
+        },
+    }
+
+
+def regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare results with the measurements that a baseline holds.
+
+    :return: a list of messages, one for every regressed measurement.
+    """
+    found = []
+    for functions, scale in sorted(results['scales'].items(),
+                                   key=lambda item: int(item[0])):
+        baseline_scale = baseline['scales'].get(functions)
+        if not baseline_scale:
+            continue
+        for name, measured in scale['operations'].items():
+            expected = baseline_scale['operations'].get(name)
+            if not expected:
+                continue
+            if 'wall' in expected and \
+                    measured['wall'] > expected['wall'] * (1 + tolerance) and \
+                    measured['wall'] - expected['wall'] > MIN_WALL_DELTA:
+                found.append(
+                    '{} functions, {}: {:.3f}s, baseline {:.3f}s'.format(
+                        functions, name, measured['wall'], expected['wall']))
+            if measured['subprocesses'] > expected['subprocesses']:
+                found.append(
+                    '{} functions, {}: {} subprocesses, baseline {}'.format(
+                        functions,
+                        name,
+                        measured['subprocesses'],
+                        expected['subprocesses']))
+        if 'peak_rss_kb' in baseline_scale and \
+                scale['peak_rss_kb'] > baseline_scale['peak_rss_kb'] * (
+                    1 + tolerance):
+            found.append(
+                '{} functions: peak RSS {} KB, baseline {} KB'.format(
+                    functions,
+                    scale['peak_rss_kb'],
+                    baseline_scale['peak_rss_kb']))
+    return found
+
+
+def _load(path):
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except (IOError, OSError):
+        print('There is no baseline at {}.'.format(path))
+
+
+def _save(path, results):
+    with open(path, 'w') as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+    print('Saved the baseline to {}.'.format(path))
+
+
+def report(results):
+    row = '{:<26} {:>10} {:>8} {:>14}'
+    for functions, scale in sorted(results['scales'].items(),
+                                   key=lambda item: int(item[0])):
+        print('{} functions, peak RSS {} KB'.format(
+            functions, scale['peak_rss_kb']))
+        print(row.format('operation', 'wall (s)', 'procs', 'peak RSS (KB)'))
+        for name, measured in scale['operations'].items():
+            print(row.format(
+                name,
+                '{:.4f}'.format(measured['wall']),
+                measured['subprocesses'],
+                measured['peak_rss_kb']))
+        print('')
+
+
+def run(functions=None,
+        latency=DEFAULT_LATENCY,
+        output_bytes=DEFAULT_OUTPUT_BYTES,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        baseline_path=DEFAULT_BASELINE,
+        tolerance=DEFAULT_TOLERANCE,
+        save_baseline=False,
+        local_baseline_path=DEFAULT_LOCAL_BASELINE):
+    parameters = {
+        'latency': latency,
+        'output_bytes': output_bytes,
+        'max_concurrency': max_concurrency,
+    }
+    results = {
+        'parameters': parameters,
+        'scales': {
+            str(count): run_scale_in_process(
+                count, latency, output_bytes, max_concurrency)
+            for count in functions or DEFAULT_FUNCTIONS
+        }
+    }
+    report(results)
+    if save_baseline:
+        _save(baseline_path, subprocess_counts(results))
+        _save(local_baseline_path, results)
+        return []
+    found = []
+    baseline = _load(baseline_path)
+    if baseline:
+        found.extend(regressions(results, baseline, tolerance))
+    local_baseline = _load(local_baseline_path)
+    if local_baseline and local_baseline.get('parameters') != parameters:
+        print('The local baseline was measured with {}, not comparing '
+              'wall times.'.format(local_baseline.get('parameters')))
+    elif local_baseline:
+        found.extend(
+            message for message in regressions(
+                results, local_baseline, tolerance)
+            if message not in found)
+    for message in found:
+        print('REGRESSION {}'.format(message))
+    if not found:
+        print('No regressions.')
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument(
+        '--functions',
+        type=lambda value: [int(count) for count in value.split(',')],
+        default=DEFAULT_FUNCTIONS)
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY)
+    parser.add_argument(
+        '--output-bytes', type=int, default=DEFAULT_OUTPUT_BYTES)
+    parser.add_argument(
+        '--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--local-baseline', default=DEFAULT_LOCAL_BASELINE)
+    parser.add_argument(
+        '--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true')
+    # Used by run to measure a single number of functions in a new process.
+    parser.add_argument('--scale', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.scale is not None:
+        print(json.dumps(run_scale(
+            args.scale,
+            args.latency,
+            args.output_bytes,
+            args.max_concurrency)))
+        sys.exit(0)
+    sys.exit(1 if run(args.functions,
+                      args.latency,
+                      args.output_bytes,
+                      args.max_concurrency,
+                      args.baseline,
+                      args.tolerance,
+                      args.save_baseline,
+                      args.local_baseline) else 0)
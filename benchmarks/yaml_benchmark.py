@@ -0,0 +1,109 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the libyaml and the pure python YAML paths of serverless_sdk on
+a synthetic serverless.yml.
+
+    python benchmarks/yaml_benchmark.py [--functions 1000] [--repeat 5]
+"""
+
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serverless_sdk import yaml_utils  # noqa: E402
+
+
+def synthetic_config(functions=1000):
+    return {
+        'service': 'benchmark-service',
+        'provider': {
+            'name': 'aws',
+            'runtime': 'python3.9',
+            'region': 'us-east-1',
+            'iam': {
+                'role': {
+                    'statements': [
+                        {
+                            'Effect': 'Allow',
+                            'Action': ['s3:GetObject', 's3:PutObject'],
+                            'Resource': 'arn:aws:s3:::benchmark/*',
+                        }
+                    ]
+                }
+            }
+        },
+        'functions': [
+            {
+                'function_{}'.format(index): {
+                    'handler': 'handler_{}.handle'.format(index),
+                    'memorySize': 128 + index % 4 * 128,
+                    'timeout': 30,
+                    'events': [
+                        {
+                            'http': {
+                                'path': 'function/{}'.format(index),
+                                'method': 'get',
+                            }
+                        },
+                        {'schedule': 'rate(10 minutes)'},
+                    ],
+                    'environment': {
+                        'INDEX': str(index),
+                        'STAGE': 'dev',
+                    },
+                }
+            }
+            for index in range(functions)
+        ]
+    }
+
+
+def run(functions=1000, repeat=5):
+    config = synthetic_config(functions)
+    results = {}
+    for use_libyaml in (False, True):
+        dumped = yaml_utils.safe_dump(
+            config, default_flow_style=False, use_libyaml=use_libyaml)
+        dump_time = min(timeit.repeat(
+            lambda: yaml_utils.safe_dump(
+                config, default_flow_style=False, use_libyaml=use_libyaml),
+            number=1,
+            repeat=repeat))
+        load_time = min(timeit.repeat(
+            lambda: yaml_utils.safe_load(dumped, use_libyaml=use_libyaml),
+            number=1,
+            repeat=repeat))
+        results[use_libyaml] = (dumped, load_time, dump_time)
+    if results[True][0] != results[False][0]:
+        raise RuntimeError('libyaml and pure python dumps differ.')
+    libyaml = yaml_utils.loader() is not yaml_utils.loader(False)
+    print('{} functions, libyaml available: {}'.format(functions, libyaml))
+    print('{:<8} {:>10} {:>10}'.format('path', 'load (s)', 'dump (s)'))
+    for use_libyaml, name in ((False, 'python'), (True, 'libyaml')):
+        _, load_time, dump_time = results[use_libyaml]
+        print('{:<8} {:>10.4f} {:>10.4f}'.format(name, load_time, dump_time))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--functions', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.functions, args.repeat)
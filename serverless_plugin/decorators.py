@@ -12,22 +12,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import json
+import time
 from functools import wraps
+from contextlib import contextmanager
+
+from serverless_sdk.timing import operation_timer, timed
 
 from .utils import initialize_serverless, generate_traceback_exception
 
-from cloudify.exceptions import NonRecoverableError
+from cloudify.exceptions import NonRecoverableError, RecoverableError
+
+TIMINGS = 'timings'
+PROFILE_DIRECTORY = '.profiles'
+
+
+@contextmanager
+def profiled(serverless, operation):
+    """Write a cProfile dump of the block beside the instance directory,
+    so that it is not packaged with the service, if profile is set in
+    serverless_config.
+    """
+    if not serverless.serverless_config.get('profile'):
+        yield
+        return
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        directory = serverless._beside_root_directory(PROFILE_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, '{}-{}.prof'.format(
+            operation, time.strftime('%Y%m%d%H%M%S')))
+        profile.dump_stats(path)
+        serverless.logger.info('Wrote the profile of {} to {}.'.format(
+            operation, path))
+
+
+def store_timings(ctx, timer):
+    """Keep the timings of the last run of every operation in runtime
+    properties, and log them as a JSON line.
+    """
+    timer.stop()
+    record = timer.record()
+    timings = dict(ctx.instance.runtime_properties.get(TIMINGS) or {})
+    timings[timer.operation] = record
+    ctx.instance.runtime_properties[TIMINGS] = timings
+    ctx.logger.info('Operation timings: {}'.format(
+        json.dumps(record, sort_keys=True)))
+
+
+def export_trace(ctx, serverless, timer):
+    """Append the spans of the operation to the trace file of the
+    deployment, if trace_format is set. A trace that cannot be written
+    does not fail the operation.
+    """
+    try:
+        if serverless.trace_path:
+            serverless.write_trace(timer.trace())
+    except Exception as error:
+        ctx.logger.error('Failed to write the trace of {}: {}'.format(
+            timer.operation, error))
 
 
 def with_serverless(func):
     @wraps(func)
     def function(*args, **kwargs):
         ctx = kwargs['ctx']
-        kwargs['serverless'] = initialize_serverless(ctx)
-        try:
-            func(*args, **kwargs)
-        except Exception as error:
-            error_traceback = generate_traceback_exception()
-            raise NonRecoverableError('{0}'.format(str(error)),
-                                      causes=[error_traceback])
+        with operation_timer(ctx, func.__name__) as timer:
+            try:
+                with timed('initialize'):
+                    kwargs['serverless'] = initialize_serverless(ctx)
+                try:
+                    with profiled(kwargs['serverless'], func.__name__):
+                        func(*args, **kwargs)
+                except RecoverableError:
+                    raise
+                except Exception as error:
+                    error_traceback = generate_traceback_exception()
+                    raise NonRecoverableError('{0}'.format(str(error)),
+                                              causes=[error_traceback])
+            finally:
+                if 'serverless' in kwargs:
+                    with timed('prune_scratch'):
+                        kwargs['serverless'].prune_scratch()
+                store_timings(ctx, timer)
+                if 'serverless' in kwargs:
+                    export_trace(ctx, kwargs['serverless'], timer)
     return function
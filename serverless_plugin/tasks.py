@@ -13,15 +13,182 @@
 # limitations under the License.
 
 import os
+import time
 
 from cloudify.decorators import operation
-from cloudify.exceptions import NonRecoverableError
+from cloudify.exceptions import NonRecoverableError, RecoverableError
+from serverless_sdk import CloudifyServerlessBatchError
+from serverless_sdk.store import ContentStore
+from serverless_sdk.parsers import (
+    append_series, metrics_series, parse_metrics, parse_service_information)
+from serverless_sdk.throttle import is_throttling_error
+from serverless_sdk.utils import run_concurrently, sha256_file
 
 from . import decorators
 
 
-def _download_handlers(ctx, handler_path, target_path):
-    ctx.download_resource(handler_path, target_path)
+HANDLERS = 'handlers'
+DEPLOY_FINGERPRINT = 'deploy_fingerprint'
+DEPLOY_STATE = 'deploy_state'
+INFO_CACHE = 'info_cache'
+DEFAULT_INFO_CACHE_TTL = 3600
+TARGETS = 'targets'
+METRICS = 'metrics'
+METRICS_HIGH_WATER = 'metrics_high_water'
+DEFAULT_METRICS_RETENTION = 1000
+HANDLER_STORE = '.handlers'
+
+
+def _download_handlers(ctx, serverless):
+    """Download every distinct function path once into a store keyed by
+    sha256, and place it in the service directory. The store is kept
+    beside the service directory, so that it is not packaged.
+    The manifest of previous downloads is kept in runtime properties,
+    so unchanged handlers of the same blueprint are not downloaded again.
+    """
+    store = ContentStore(serverless._beside_root_directory(HANDLER_STORE))
+    manifest = ctx.instance.runtime_properties.get(HANDLERS, {})
+    blueprint_id = ctx.blueprint.id
+    paths = []
+    for function in serverless.functions:
+        filepath = function.get('path')
+        if not filepath:
+            raise NonRecoverableError(
+                'Function path does not exist. '
+                'Provided function: {}'.format(function))
+        if filepath not in paths:
+            paths.append(filepath)
+
+    def download(filepath):
+        target = os.path.join(
+            serverless.root_directory, os.path.basename(filepath))
+        entry = manifest.get(filepath, {})
+        if entry.get('blueprint') == blueprint_id and \
+                store.contains(entry.get('sha256')) and \
+                sha256_file(target) == entry['sha256']:
+            ctx.logger.debug(
+                'Handler {} is unchanged, skipping download.'.format(
+                    filepath))
+            return entry
+        temp_path = store.temp_path()
+        try:
+            ctx.download_resource(filepath, temp_path)
+            digest = store.add(temp_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        store.link(digest, target)
+        return {'sha256': digest, 'blueprint': blueprint_id}
+
+    outcomes = run_concurrently(download, paths)
+    ctx.instance.runtime_properties[HANDLERS] = {
+        filepath: entry for filepath, entry, error in outcomes if not error}
+    _raise_for_failures('download handlers of', outcomes)
+
+
+def _raise_for_failures(action, outcomes, kind='functions'):
+    errors = [(name, error) for name, _, error in outcomes if error]
+    if not errors:
+        return
+    message = 'Failed to {} {}: {}'.format(
+        action, kind, '; '.join('{}: {}'.format(*e) for e in errors))
+    # When the provider only throttled us, the operation may be retried.
+    if all(is_throttling_error(error) for _, error in errors):
+        raise RecoverableError(message)
+    raise NonRecoverableError(message)
+
+
+def _cache_info(ctx, fingerprint, info):
+    ctx.instance.runtime_properties[INFO_CACHE] = {
+        'fingerprint': fingerprint,
+        'time': int(time.time()),
+        'info': info,
+    }
+
+
+def _cached_info(ctx, serverless, refresh=False):
+    """Return the service info from the cache, if it was cached for the
+    current deploy less than info_cache_ttl seconds ago, or else from
+    serverless info, and cache it.
+    """
+    fingerprint = ctx.instance.runtime_properties.get(DEPLOY_FINGERPRINT)
+    ttl = serverless.serverless_config.get(
+        'info_cache_ttl', DEFAULT_INFO_CACHE_TTL)
+    cache = ctx.instance.runtime_properties.get(INFO_CACHE) or {}
+    if not refresh and ttl and cache.get('info') and \
+            cache.get('fingerprint') == fingerprint and \
+            time.time() - cache.get('time', 0) < ttl:
+        ctx.logger.debug('Using the cached service info.')
+        return cache['info']
+    info = serverless.info()
+    _cache_info(ctx, fingerprint, info)
+    return info
+
+
+def _deploy_targets(ctx, serverless, fingerprint, max_concurrency=None):
+    """Deploy the targets that were not deployed with this fingerprint
+    yet, and record the info or the error of every target.
+    """
+    records = dict(ctx.instance.runtime_properties.get(TARGETS, {}))
+    pending = []
+    for target in serverless.targets:
+        name = serverless.target_name(target)
+        if records.get(name, {}).get('fingerprint') == fingerprint:
+            ctx.logger.info(
+                'Target {} is up to date, skipping deploy.'.format(name))
+        else:
+            pending.append(target)
+    outcomes = serverless.deploy_targets(
+        pending, fingerprint, max_concurrency)
+    for target, output, error in outcomes:
+        record = {'stage': target.get('stage'),
+                  'region': target.get('region')}
+        if error:
+            record['error'] = str(error)
+        else:
+            record['fingerprint'] = fingerprint
+            record['info'] = parse_service_information(output)
+        records[serverless.target_name(target)] = record
+    ctx.instance.runtime_properties[TARGETS] = records
+    _raise_for_failures(
+        'deploy',
+        [(serverless.target_name(target), output, error)
+         for target, output, error in outcomes],
+        'targets')
+
+
+def _metrics_series(serverless, outcomes, metrics=None, retention=None):
+    """Parse the metrics outputs into series by function, and append them
+    to the stored series. The metrics of a single function are keyed by
+    that function, the service wide metrics by the service name, and an
+    output that can not be parsed is kept as is if there is no series yet.
+
+    :return: the metrics, and the names whose metrics were collected.
+    """
+    service_name = serverless.resource_config.get('name')
+    metrics = dict(metrics or {})
+    collected = []
+    for name, output, error in outcomes:
+        if error:
+            continue
+        records = parse_metrics(output)
+        if not records:
+            if 'start' not in metrics.get(name, {}):
+                metrics[name] = {'output': output}
+            continue
+        if name == service_name:
+            new_series = metrics_series(records, service_name)
+        else:
+            new_series = metrics_series(
+                [dict(record, function=name) for record in records])
+        for key, series in new_series.items():
+            stored = metrics.get(key) or {}
+            stored = {column: list(values)
+                      for column, values in stored.items()
+                      if column != 'output'}
+            metrics[key] = append_series(stored, series, retention)
+        collected.append(name)
+    return metrics, collected
 
 
 BINARY_NAME = "serverless"
@@ -36,37 +203,84 @@ def create(serverless, **_):
 @operation
 @decorators.with_serverless
 def configure(ctx, serverless, **_):
-    for function in serverless.functions:
-        filepath = function.get('path')
-        if not filepath:
-            raise NonRecoverableError(
-                'Function path does not exist. '
-                'Provided function: {}'.format(function))
-        filename = os.path.basename(filepath)
-        _download_handlers(
-            ctx,
-            filepath,
-            os.path.join(serverless.root_directory, filename)
-        )
-    serverless.configure()
+    with serverless.service_lock():
+        _download_handlers(ctx, serverless)
+        if not serverless.configure():
+            ctx.logger.info('The serverless configuration did not change.')
 
 
 @operation
 @decorators.with_serverless
-def start(serverless, **_):
-    serverless.deploy()
+def start(ctx, serverless, max_concurrency=None, max_processes=None, **_):
+    if max_processes:
+        serverless.serverless_config = dict(
+            serverless.serverless_config, max_processes=max_processes)
+    with serverless.service_lock():
+        state = serverless.deploy_state()
+        fingerprint = serverless.fingerprint(state)
+        if serverless.targets:
+            _deploy_targets(ctx, serverless, fingerprint, max_concurrency)
+            return
+        if ctx.instance.runtime_properties.get(DEPLOY_FINGERPRINT) == \
+                fingerprint:
+            ctx.logger.info(
+                'The service configuration, handlers and env have not changed '
+                'since the last deploy, skipping serverless deploy.')
+            return
+        try:
+            output = serverless.deploy(
+                ctx.instance.runtime_properties.get(DEPLOY_STATE),
+                state,
+                max_concurrency)
+        except CloudifyServerlessBatchError as error:
+            _raise_for_failures('deploy', error.outcomes)
+            raise
+        # Deploy prints the service information, cache it so that poststart
+        # does not need to run serverless info.
+        info = parse_service_information(output)
+        if info:
+            _cache_info(ctx, fingerprint, info)
+        else:
+            ctx.instance.runtime_properties.pop(INFO_CACHE, None)
+        ctx.instance.runtime_properties[DEPLOY_FINGERPRINT] = fingerprint
+        ctx.instance.runtime_properties[DEPLOY_STATE] = state
 
 
 @operation
 @decorators.with_serverless
 def poststart(ctx, serverless, **_):
-    ctx.instance.runtime_properties['info'] = serverless.info()
+    if serverless.targets:
+        records = dict(ctx.instance.runtime_properties.get(TARGETS, {}))
+        for target in serverless.targets:
+            record = records.get(serverless.target_name(target))
+            if record and 'fingerprint' in record and not record['info']:
+                record['info'] = serverless.info(target)
+        ctx.instance.runtime_properties[TARGETS] = records
+        return
+    ctx.instance.runtime_properties['info'] = _cached_info(ctx, serverless)
 
 
 @operation
 @decorators.with_serverless
-def stop(serverless, **_):
+def stop(ctx, serverless, max_concurrency=None, **_):
+    if serverless.targets:
+        outcomes = serverless.destroy_targets(
+            serverless.targets, max_concurrency)
+        records = dict(ctx.instance.runtime_properties.get(TARGETS, {}))
+        for target, _, error in outcomes:
+            if not error:
+                records.pop(serverless.target_name(target), None)
+        ctx.instance.runtime_properties[TARGETS] = records
+        _raise_for_failures(
+            'remove',
+            [(serverless.target_name(target), output, error)
+             for target, output, error in outcomes],
+            'targets')
+        return
     serverless.destroy()
+    ctx.instance.runtime_properties.pop(INFO_CACHE, None)
+    ctx.instance.runtime_properties.pop(DEPLOY_FINGERPRINT, None)
+    ctx.instance.runtime_properties.pop(DEPLOY_STATE, None)
 
 
 @operation
@@ -77,19 +291,65 @@ def delete(serverless, **_):
 
 @operation
 @decorators.with_serverless
-def invoke(serverless, **_):
-    for function in serverless.functions:
-        serverless.invoke(function['name'])
+def invoke(ctx, serverless, max_concurrency=None, **_):
+    names = [function['name'] for function in serverless.functions]
+    results = {}
+    if ctx.operation.retry_number:
+        # A retry after throttling invokes only the functions that were not
+        # invoked yet.
+        results = dict(ctx.instance.runtime_properties.get('invoke') or {})
+        names = [name for name in names if name not in results]
+    outcomes = serverless.run_concurrently(
+        serverless.invoke, names, max_concurrency)
+    results.update(
+        (name, result) for name, result, error in outcomes if not error)
+    ctx.instance.runtime_properties['invoke'] = results
+    _raise_for_failures('invoke', outcomes)
 
 
 @operation
 @decorators.with_serverless
-def metrics(serverless, **_):
+def metrics(ctx,
+            serverless,
+            max_concurrency=None,
+            retention=DEFAULT_METRICS_RETENTION,
+            **_):
+    """Collect the metrics since the last collection of every function,
+    and append them to the stored series.
+    """
+    service_name = serverless.resource_config.get('name')
     if not serverless.functions:
-        serverless.metrics()
+        names = [service_name]
     else:
-        for function in serverless.functions:
-            serverless.metrics(function['name'])
+        names = [function['name'] for function in serverless.functions]
+    high_water = dict(
+        ctx.instance.runtime_properties.get(METRICS_HIGH_WATER, {}))
+    end_time = int(time.time())
+
+    def collect(name):
+        return serverless.metrics(
+            name if serverless.functions else None,
+            high_water.get(name),
+            end_time)
+
+    outcomes = serverless.run_concurrently(collect, names, max_concurrency)
+    metrics, collected = _metrics_series(
+        serverless,
+        outcomes,
+        ctx.instance.runtime_properties.get(METRICS),
+        retention)
+    for name in collected:
+        high_water[name] = end_time
+    ctx.instance.runtime_properties[METRICS] = metrics
+    ctx.instance.runtime_properties[METRICS_HIGH_WATER] = high_water
+    _raise_for_failures('collect metrics for', outcomes)
+
+
+@operation
+@decorators.with_serverless
+def info(ctx, serverless, refresh=False, **_):
+    ctx.instance.runtime_properties['info'] = _cached_info(
+        ctx, serverless, refresh)
 
 
 @operation
@@ -99,15 +359,22 @@ def install_binary(ctx, serverless, **_):
         installation_dir = serverless.root_directory
         installation_source = ctx.node.properties.get('installation_source')
         if installation_source:
-            serverless.install_binary(
-                ctx.node.properties.get('installation_source'),
-                installation_dir,
+            serverless.install_binary_from_cache(
+                installation_source,
                 os.path.join(installation_dir, BINARY_NAME),
-                )
+                ctx.node.properties.get('binary_cache_directory'),
+                ctx.node.properties.get('installation_checksum'),
+            )
             ctx.instance.runtime_properties['executable_path'] = os.path.join(
                 installation_dir, BINARY_NAME)
         else:
-            serverless.install_with_npm()
+            npm_config = ctx.node.properties.get('npm_config') or {}
+            serverless.install_with_npm(
+                package=npm_config.get('package'),
+                shared_prefix=npm_config.get('shared_prefix'),
+                cache=npm_config.get('cache'),
+                offline=npm_config.get('offline'),
+            )
             ctx.instance.runtime_properties['executable_path'] = \
                 serverless.executable_path
 
@@ -0,0 +1,90 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+import subprocess
+
+# The cost of importing serverless_plugin.tasks on top of what the agent
+# imports anyway to run any operation, in microseconds. It was about 6ms
+# when it was recorded, the budget leaves room for slow CI machines.
+IMPORT_TIME_BUDGET_US = 50000
+# Modules that must only be imported when they are used.
+LAZY_MODULES = [
+    'yaml',
+    'serverless_sdk.serverless',
+    'cloudify_common_sdk.utils',
+    'cloudify_common_sdk.cli_tool_base',
+    'cloudify_common_sdk.secure_property_management',
+]
+AGENT_IMPORTS = 'import cloudify.decorators, cloudify.exceptions'
+
+
+def measure_import_time(module_name):
+    """Import module_name with python -X importtime, in a process that
+    already imported what the agent imports.
+
+    :return: the cumulative import time of module_name in microseconds and
+        a dict of the self import time of every module it imported.
+    """
+    source = '{}; import {}'.format(AGENT_IMPORTS, module_name)
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', source],
+        stderr=subprocess.PIPE,
+        cwd=os.path.dirname(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+        check=True).stderr.decode('utf-8')
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        if not self_time.strip().isdigit():
+            continue
+        modules[name.strip()] = (int(self_time), int(cumulative))
+    # The agent imports are reported before module_name, so only the
+    # modules from the last top level import belong to module_name.
+    names = list(modules)
+    start = max(i for i, line_name in enumerate(names)
+                if line_name == 'cloudify.decorators' or
+                line_name == 'cloudify.exceptions') + 1
+    imported = {name: modules[name][0] for name in names[start:]}
+    return modules[module_name][1], imported
+
+
+class ImportTimeTest(unittest.TestCase):
+
+    def test_tasks_import_time(self):
+        cumulative, imported = measure_import_time('serverless_plugin.tasks')
+        for module_name in LAZY_MODULES:
+            self.assertNotIn(module_name, imported)
+        slowest = sorted(
+            imported.items(), key=lambda item: item[1], reverse=True)[:5]
+        self.assertLess(
+            cumulative,
+            IMPORT_TIME_BUDGET_US,
+            'Importing serverless_plugin.tasks took {}us, over the budget of '
+            '{}us. Slowest modules: {}'.format(
+                cumulative, IMPORT_TIME_BUDGET_US, slowest))
+
+    def test_lazy_attributes(self):
+        import serverless_sdk
+        # A module level __getattr__ is ignored before python 3.7.
+        self.assertNotIn('__getattr__', vars(serverless_sdk))
+        from serverless_sdk import Serverless
+        self.assertIs(
+            Serverless, sys.modules['serverless_sdk.serverless'].Serverless)
+        self.assertIn('Serverless', dir(serverless_sdk))
+        self.assertRaises(AttributeError, getattr, serverless_sdk, 'nothing')
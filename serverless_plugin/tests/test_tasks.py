@@ -13,16 +13,21 @@
 # limitations under the License.
 
 import os
+import json
 import shutil
 import logging
 import unittest
 import tempfile
+import zipfile
 from pathlib import Path
 from copy import deepcopy
 from functools import wraps
 
 import mock
 from cloudify.state import current_ctx
+from cloudify.exceptions import NonRecoverableError, RecoverableError
+from serverless_sdk import CloudifyServerlessBatchError
+from serverless_sdk.process import ProcessOutput
 
 from .. import tasks
 
@@ -36,6 +41,24 @@ TEST_CLIENT_CONFIG = {
         'secret': 'super_secret',
     }
 }
+DEPLOY_OUTPUT = """Deploying bar to stage dev (us-east-1)
+
+ Service deployed to stack bar-dev (112s)
+
+functions:
+  qux: bar-dev-qux (1.5 kB)
+"""
+METRICS_OUTPUT = """{name}
+January 2, 2025 2:26 PM - January 3, 2025 2:26 PM
+
+Invocations: 12
+Errors: 1
+
+{name}
+January 1, 2025 2:26 PM - January 2, 2025 2:26 PM
+
+Invocations: 5
+"""
 TEST_RESOURCE_CONFIG = {
     'name': 'bar',
     'template': 'baz',
@@ -58,6 +81,14 @@ TEST_RESOURCE_CONFIG = {
 
 class ServerlessTestBase(unittest.TestCase):
 
+    def setUp(self):
+        lock_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_directory)
+        patcher = mock.patch('serverless_sdk.serverless.BINARY_LOCK_DIRECTORY',
+                             lock_directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @staticmethod
     def get_mock_ctx(runtime_properties=None, op_name=None):
         node_properties = {
@@ -81,7 +112,8 @@ class ServerlessTestBase(unittest.TestCase):
             runtime_properties=runtime_properties or {},
         )
         mock_op = mock.Mock(
-            name=op_name or 'cloudify.interfaces.lifecycle.create'
+            name=op_name or 'cloudify.interfaces.lifecycle.create',
+            retry_number=0
         )
 
         logger = logging.getLogger(__name__)
@@ -228,6 +260,49 @@ class ServerlessTestBase(unittest.TestCase):
             )
         )
 
+    @_test_wrapper
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_configure_handler_cache(
+            self, run_sub, get_stored_prop, verify, *_, **__):
+        ctx = self.get_mock_ctx()
+        current_ctx.set(ctx=ctx)
+        resource_config = deepcopy(TEST_RESOURCE_CONFIG)
+        resource_config['functions'] = [
+            {'name': 'fn_1', 'handler': 'quux', 'path': 'shared.py'},
+            {'name': 'fn_2', 'handler': 'quux', 'path': 'shared.py'},
+            {'name': 'fn_3', 'handler': 'quux', 'path': 'other.py'},
+        ]
+        verify.return_value = dict(executable_path='serverless')
+        downloads = []
+
+        def download_resource(source, target):
+            downloads.append(source)
+            with open(target, 'w') as outfile:
+                outfile.write(source)
+
+        ctx.download_resource = download_resource
+        for _ in range(2):
+            get_stored_prop.side_effect = [
+                ctx.node.properties.get('client_config'),
+                resource_config,
+                ctx.node.properties.get('serverless_config')
+            ]
+            tasks.configure(ctx=ctx)
+        self.assertEqual(sorted(downloads), ['other.py', 'shared.py'])
+        root_dir = ctx.instance.runtime_properties['root_directory']
+        store_dir = os.path.join(
+            os.path.dirname(root_dir), '.handlers', os.path.basename(root_dir))
+        self.addCleanup(shutil.rmtree, store_dir)
+        with open(os.path.join(root_dir, 'shared.py')) as infile:
+            self.assertEqual(infile.read(), 'shared.py')
+        self.assertNotIn('.handlers', os.listdir(root_dir))
+        self.assertEqual(len(os.listdir(store_dir)), 2)
+        self.assertEqual(
+            sorted(ctx.instance.runtime_properties['handlers']),
+            ['other.py', 'shared.py'])
+
     @_test_wrapper
     @mock.patch('serverless_sdk.Serverless.tempenv')
     @mock.patch('serverless_plugin.utils.verify_executable')
@@ -262,6 +337,268 @@ class ServerlessTestBase(unittest.TestCase):
                 return_output=True
         )
 
+    @_test_wrapper
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_timings(self, run_sub, get_stored_prop, verify, *_, **__):
+        ctx = self.get_mock_ctx()
+        current_ctx.set(ctx=ctx)
+        get_stored_prop.side_effect = [
+            ctx.node.properties.get('client_config'),
+            TEST_RESOURCE_CONFIG,
+            ctx.node.properties.get('serverless_config')
+        ]
+        verify.return_value = dict(executable_path='serverless', profile=True)
+        run_sub.return_value = DEPLOY_OUTPUT
+        tasks.start(ctx=ctx)
+        record = ctx.instance.runtime_properties['timings']['start']
+        self.assertEqual(record['operation'], 'start')
+        for phase in ['initialize', 'properties', 'verify_executable',
+                      'prune_scratch']:
+            self.assertEqual(record['phases'][phase][0], 1)
+        self.assertIn('yaml_load', record['phases'])
+        root_directory = ctx.instance.runtime_properties['root_directory']
+        profile_directory = os.path.join(
+            os.path.dirname(root_directory),
+            '.profiles',
+            os.path.basename(root_directory))
+        self.addCleanup(shutil.rmtree, profile_directory)
+        self.assertNotIn('.profiles', os.listdir(root_directory))
+        profiles = os.listdir(profile_directory)
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].startswith('start-'))
+
+    @_test_wrapper
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_trace(self, run_sub, get_stored_prop, verify, *_, **__):
+        ctx = self.get_mock_ctx()
+        ctx.deployment.id = 'test_deployment'
+        current_ctx.set(ctx=ctx)
+        get_stored_prop.side_effect = [
+            ctx.node.properties.get('client_config'),
+            TEST_RESOURCE_CONFIG,
+            ctx.node.properties.get('serverless_config')
+        ]
+        trace_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, trace_directory)
+        verify.return_value = dict(
+            executable_path='serverless',
+            trace_format='jsonl',
+            trace_directory=trace_directory)
+        run_sub.return_value = DEPLOY_OUTPUT
+        tasks.start(ctx=ctx)
+        with open(os.path.join(
+                trace_directory, 'test_deployment.jsonl')) as trace_file:
+            events = [json.loads(line) for line in trace_file]
+        self.assertEqual(events[0]['kind'], 'operation')
+        self.assertEqual(events[0]['name'], 'start')
+        self.assertEqual(events[0]['node_instance'], 'test_sl_012345')
+        phases = {event['name']: event for event in events[1:]}
+        self.assertEqual(phases['initialize']['parent'], events[0]['id'])
+        self.assertEqual(
+            phases['verify_executable']['parent'],
+            phases['initialize']['id'])
+
+    @_test_wrapper
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_start_skips_unchanged(
+            self, run_sub, get_stored_prop, verify, *_, **__):
+        ctx = self.get_mock_ctx()
+        current_ctx.set(ctx=ctx)
+        verify.return_value = dict(executable_path='serverless')
+        for _ in range(2):
+            get_stored_prop.side_effect = [
+                ctx.node.properties.get('client_config'),
+                TEST_RESOURCE_CONFIG,
+                ctx.node.properties.get('serverless_config')
+            ]
+            tasks.start(ctx=ctx)
+        self.assertEqual(run_sub.call_count, 1)
+        self.assertIn('deploy_fingerprint', ctx.instance.runtime_properties)
+        get_stored_prop.side_effect = [
+            ctx.node.properties.get('client_config'),
+            TEST_RESOURCE_CONFIG,
+            ctx.node.properties.get('serverless_config')
+        ]
+        tasks.stop(ctx=ctx)
+        self.assertNotIn(
+            'deploy_fingerprint', ctx.instance.runtime_properties)
+
+    @_test_wrapper
+    @mock.patch('serverless_sdk.Serverless.deploy')
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    def test_start_throttled(self, get_stored_prop, verify, deploy, *_, **__):
+        ctx = self.get_mock_ctx()
+        current_ctx.set(ctx=ctx)
+        verify.return_value = dict(executable_path='serverless')
+        throttled = RuntimeError('TooManyRequestsException: Rate exceeded')
+        failures = [
+            ([('qux', None, throttled)], RecoverableError),
+            ([('qux', None, throttled), ('quux', None, RuntimeError('no'))],
+             NonRecoverableError),
+        ]
+        for outcomes, error in failures:
+            get_stored_prop.side_effect = [
+                ctx.node.properties.get('client_config'),
+                TEST_RESOURCE_CONFIG,
+                ctx.node.properties.get('serverless_config')
+            ]
+            deploy.side_effect = CloudifyServerlessBatchError(
+                'Failed to deploy functions', outcomes)
+            self.assertRaisesRegex(
+                error, 'Failed to deploy functions: qux: TooMany',
+                tasks.start, ctx=ctx)
+        self.assertNotIn(
+            'deploy_fingerprint', ctx.instance.runtime_properties)
+
+    @_test_wrapper
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_start_targets(
+            self, run_sub, get_stored_prop, verify, *_, **__):
+        ctx = self.get_mock_ctx()
+        current_ctx.set(ctx=ctx)
+        resource_config = deepcopy(TEST_RESOURCE_CONFIG)
+        resource_config['targets'] = [
+            {'stage': 'dev', 'region': 'us-east-1'},
+            {'stage': 'prod', 'region': 'eu-west-1'},
+            {'stage': 'prod', 'region': 'us-west-2'},
+        ]
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        verify.return_value = dict(
+            executable_path='serverless', artifact_cache_directory=cache_dir)
+        failing = ['us-west-2']
+
+        def fake_execute(command, *_, **__):
+            options = dict(zip(command[2::2], command[3::2]))
+            if command[1] == 'package':
+                os.makedirs(options['--package'])
+            elif command[1] == 'deploy':
+                if options['--region'] in failing:
+                    raise RuntimeError('boom')
+                return DEPLOY_OUTPUT.replace(
+                    'dev', options['--stage']).replace(
+                    'us-east-1', options['--region'])
+
+        def run(task):
+            get_stored_prop.side_effect = [
+                ctx.node.properties.get('client_config'),
+                resource_config,
+                ctx.node.properties.get('serverless_config')
+            ]
+            task(ctx=ctx)
+
+        run_sub.side_effect = fake_execute
+        self.assertRaisesRegex(
+            NonRecoverableError,
+            'Failed to deploy targets: prod-us-west-2: boom',
+            run,
+            tasks.start)
+        self.assertEqual(
+            [c[0][0][1] for c in run_sub.call_args_list],
+            ['package'] * 3 + ['deploy'] * 3)
+        targets = ctx.instance.runtime_properties['targets']
+        self.assertEqual(targets['prod-eu-west-1']['info']['stack'],
+                         'bar-prod')
+        self.assertEqual(targets['prod-us-west-2']['error'], 'boom')
+        self.assertNotIn('fingerprint', targets['prod-us-west-2'])
+
+        del failing[:]
+        run_sub.reset_mock()
+        run(tasks.start)
+        self.assertEqual(
+            [c[0][0][1:] for c in run_sub.call_args_list],
+            [['deploy',
+              '--package', mock.ANY,
+              '--stage', 'prod',
+              '--region', 'us-west-2']])
+        run_sub.reset_mock()
+        run(tasks.poststart)
+        run_sub.assert_not_called()
+        self.assertEqual(
+            sorted(ctx.instance.runtime_properties['targets']),
+            ['dev-us-east-1', 'prod-eu-west-1', 'prod-us-west-2'])
+        run(tasks.stop)
+        self.assertEqual(run_sub.call_count, 3)
+        self.assertEqual(ctx.instance.runtime_properties['targets'], {})
+
+    @_test_wrapper
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_poststart_uses_deploy_output(
+            self, run_sub, get_stored_prop, verify, *_, **__):
+        verify.return_value = dict(executable_path='serverless')
+        # serverless v3 prints the deploy notices to stderr.
+        notices, section = DEPLOY_OUTPUT.rsplit('\n\n', 1)
+        for output in [DEPLOY_OUTPUT, ProcessOutput(section, notices)]:
+            ctx = self.get_mock_ctx()
+            current_ctx.set(ctx=ctx)
+            run_sub.reset_mock()
+            run_sub.return_value = output
+            for task in [tasks.start, tasks.poststart]:
+                get_stored_prop.side_effect = [
+                    ctx.node.properties.get('client_config'),
+                    TEST_RESOURCE_CONFIG,
+                    ctx.node.properties.get('serverless_config')
+                ]
+                task(ctx=ctx)
+            self.assertEqual(run_sub.call_count, 1)
+            self.assertEqual(
+                ctx.instance.runtime_properties['info'],
+                {
+                    'service': 'bar',
+                    'stage': 'dev',
+                    'region': 'us-east-1',
+                    'stack': 'bar-dev',
+                    'functions': {'qux': 'bar-dev-qux'},
+                })
+            self.assertNotIn(
+                'deploy_info', ctx.instance.runtime_properties)
+
+    @_test_wrapper
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_info_cache(self, run_sub, get_stored_prop, verify, *_, **__):
+        ctx = self.get_mock_ctx()
+        current_ctx.set(ctx=ctx)
+        verify.return_value = dict(
+            executable_path='serverless', info_cache_ttl=60)
+
+        def run(task, now, **kwargs):
+            get_stored_prop.side_effect = [
+                ctx.node.properties.get('client_config'),
+                TEST_RESOURCE_CONFIG,
+                ctx.node.properties.get('serverless_config')
+            ]
+            with mock.patch('serverless_plugin.tasks.time.time',
+                            return_value=now):
+                task(ctx=ctx, **kwargs)
+            return [c[0][0][1] for c in run_sub.call_args_list]
+
+        run_sub.return_value = DEPLOY_OUTPUT
+        self.assertEqual(run(tasks.start, 1000), ['deploy'])
+        self.assertEqual(run(tasks.poststart, 1010), ['deploy'])
+        self.assertEqual(run(tasks.info, 1059), ['deploy'])
+        run_sub.return_value = 'service: bar'
+        self.assertEqual(run(tasks.info, 1060), ['deploy', 'info'])
+        self.assertEqual(ctx.instance.runtime_properties['info'],
+                         {'service': 'bar'})
+        self.assertEqual(run(tasks.info, 1061), ['deploy', 'info'])
+        self.assertEqual(run(tasks.info, 1062, refresh=True),
+                         ['deploy', 'info', 'info'])
+        run(tasks.stop, 1063)
+        self.assertNotIn('info_cache', ctx.instance.runtime_properties)
+
     @_test_wrapper
     @mock.patch('serverless_sdk.Serverless.tempenv')
     @mock.patch('serverless_plugin.utils.verify_executable')
@@ -346,6 +683,100 @@ class ServerlessTestBase(unittest.TestCase):
                 return_output=True
         )
 
+    @_test_wrapper
+    @mock.patch('serverless_sdk.Serverless.tempenv')
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_invoke_concurrent(
+            self, run_sub, get_stored_prop, verify, *_, **__):
+        ctx = self.get_mock_ctx()
+        current_ctx.set(ctx=ctx)
+        resource_config = deepcopy(TEST_RESOURCE_CONFIG)
+        resource_config['functions'] = [
+            {'name': 'fn_{}'.format(i), 'handler': 'quux'} for i in range(8)
+        ]
+        get_stored_prop.side_effect = [
+            ctx.node.properties.get('client_config'),
+            resource_config,
+            ctx.node.properties.get('serverless_config')
+        ]
+        verify.return_value = dict(executable_path='serverless')
+
+        def fake_execute(command, *_, **__):
+            if command[-1] == 'fn_3':
+                raise RuntimeError('boom')
+            return 'output of {}'.format(command[-1])
+
+        run_sub.side_effect = fake_execute
+        self.assertRaisesRegex(
+            NonRecoverableError,
+            r'Failed to invoke functions: fn_3: boom',
+            tasks.invoke,
+            ctx=ctx,
+            max_concurrency=3)
+        self.assertEqual(run_sub.call_count, 8)
+        self.assertEqual(
+            list(ctx.instance.runtime_properties['invoke'].items()),
+            [('fn_{}'.format(i), 'output of fn_{}'.format(i))
+             for i in range(8) if i != 3])
+
+    @_test_wrapper
+    @mock.patch('serverless_sdk.Serverless.tempenv')
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_invoke_throttled(
+            self, run_sub, get_stored_prop, verify, *_, **__):
+        ctx = self.get_mock_ctx()
+        current_ctx.set(ctx=ctx)
+        resource_config = deepcopy(TEST_RESOURCE_CONFIG)
+        resource_config['functions'] = [
+            {'name': 'fn_{}'.format(i), 'handler': 'quux'} for i in range(3)
+        ]
+        get_stored_prop.side_effect = [
+            ctx.node.properties.get('client_config'),
+            resource_config,
+            ctx.node.properties.get('serverless_config')
+        ]
+        verify.return_value = dict(
+            executable_path='serverless',
+            throttling={'retries': 2, 'backoff_base': 0.01})
+
+        def fake_execute(command, *_, **__):
+            if command[-1] == 'fn_1':
+                raise RuntimeError('TooManyRequestsException: Rate exceeded')
+            return 'output of {}'.format(command[-1])
+
+        run_sub.side_effect = fake_execute
+        self.assertRaisesRegex(
+            RecoverableError,
+            r'Failed to invoke functions: fn_1: TooManyRequestsException',
+            tasks.invoke,
+            ctx=ctx)
+        self.assertEqual(run_sub.call_count, 5)
+        self.assertEqual(
+            sorted(ctx.instance.runtime_properties['invoke']),
+            ['fn_0', 'fn_2'])
+
+        # The retry of the operation invokes only the throttled function.
+        get_stored_prop.side_effect = [
+            ctx.node.properties.get('client_config'),
+            resource_config,
+            ctx.node.properties.get('serverless_config')
+        ]
+        ctx.operation.retry_number = 1
+        run_sub.reset_mock()
+        run_sub.side_effect = None
+        run_sub.return_value = 'output of fn_1'
+        tasks.invoke(ctx=ctx)
+        self.assertEqual(
+            [c[0][0][-1] for c in run_sub.call_args_list], ['fn_1'])
+        self.assertEqual(
+            ctx.instance.runtime_properties['invoke'],
+            {'fn_{}'.format(i): 'output of fn_{}'.format(i)
+             for i in range(3)})
+
     @_test_wrapper
     @mock.patch('serverless_sdk.Serverless.tempenv')
     @mock.patch('serverless_plugin.utils.verify_executable')
@@ -374,6 +805,8 @@ class ServerlessTestBase(unittest.TestCase):
                     'metrics',
                     '--function',
                     'qux',
+                    '--endTime',
+                    mock.ANY,
                 ],
                 ctx.instance.runtime_properties['root_directory'],
                 additional_args={
@@ -388,6 +821,85 @@ class ServerlessTestBase(unittest.TestCase):
                 return_output=True
         )
 
+    @_test_wrapper
+    @mock.patch('serverless_sdk.Serverless.tempenv')
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_metrics_incremental(
+            self, run_sub, get_stored_prop, verify, *_, **__):
+        ctx = self.get_mock_ctx()
+        current_ctx.set(ctx=ctx)
+        verify.return_value = dict(executable_path='serverless')
+        window = '{day} 2:26 PM - {day} 3:26 PM\n\nInvocations: {count}\n'
+        outputs = [
+            'qux\n' + window.format(day='January 1, 2025', count=1),
+            'qux\n' + window.format(day='January 1, 2025', count=1) +
+            '\nqux\n' + window.format(day='January 2, 2025', count=2),
+            'qux\n' + window.format(day='January 3, 2025', count=3),
+        ]
+        run_sub.side_effect = outputs
+        for now in [1000, 2000, 3000]:
+            get_stored_prop.side_effect = [
+                ctx.node.properties.get('client_config'),
+                TEST_RESOURCE_CONFIG,
+                ctx.node.properties.get('serverless_config')
+            ]
+            with mock.patch('serverless_plugin.tasks.time.time',
+                            return_value=now):
+                tasks.metrics(ctx=ctx, retention=2)
+        self.assertEqual(
+            [c[0][0][4:] for c in run_sub.call_args_list],
+            [['--endTime', '1970-01-01T00:16:40Z'],
+             ['--startTime', '1970-01-01T00:16:40Z',
+              '--endTime', '1970-01-01T00:33:20Z'],
+             ['--startTime', '1970-01-01T00:33:20Z',
+              '--endTime', '1970-01-01T00:50:00Z']])
+        self.assertEqual(
+            ctx.instance.runtime_properties['metrics']['qux']['invocations'],
+            [2, 3])
+        self.assertEqual(
+            ctx.instance.runtime_properties['metrics_high_water'],
+            {'qux': 3000})
+
+    @_test_wrapper
+    @mock.patch('serverless_sdk.Serverless.tempenv')
+    @mock.patch('serverless_plugin.utils.verify_executable')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_metrics_aggregated(
+            self, run_sub, get_stored_prop, verify, *_, **__):
+        ctx = self.get_mock_ctx()
+        current_ctx.set(ctx=ctx)
+        resource_config = deepcopy(TEST_RESOURCE_CONFIG)
+        resource_config['functions'] = [
+            {'name': 'fn_{}'.format(i), 'handler': 'quux'} for i in range(4)
+        ]
+        get_stored_prop.side_effect = [
+            ctx.node.properties.get('client_config'),
+            resource_config,
+            ctx.node.properties.get('serverless_config')
+        ]
+        verify.return_value = dict(executable_path='serverless')
+
+        def fake_execute(command, *_, **__):
+            name = command[command.index('--function') + 1]
+            if name == 'fn_3':
+                return 'fn_3'
+            return METRICS_OUTPUT.format(name=name)
+
+        run_sub.side_effect = fake_execute
+        tasks.metrics(ctx=ctx, max_concurrency=2)
+        self.assertEqual(run_sub.call_count, 4)
+        metrics = ctx.instance.runtime_properties['metrics']
+        self.assertEqual(sorted(metrics), ['fn_0', 'fn_1', 'fn_2', 'fn_3'])
+        self.assertEqual(metrics['fn_3'], {'output': 'fn_3'})
+        self.assertEqual(
+            {key: len(values) for key, values in metrics['fn_0'].items()},
+            {'start': 2, 'end': 2, 'invocations': 2, 'errors': 2})
+        self.assertEqual(metrics['fn_0']['invocations'], [5, 12])
+        self.assertEqual(metrics['fn_0']['errors'], [None, 1])
+
     @_test_wrapper
     @mock.patch('cloudify_common_sdk.utils.run_subprocess')
     @mock.patch('serverless_plugin.utils.get_stored_property')
@@ -397,34 +909,75 @@ class ServerlessTestBase(unittest.TestCase):
                             get_stored_prop,
                             run_sub_sdk,
                             *_, **__):
-        ctx = self.get_binary_type_mock_ctx()
-        current_ctx.set(ctx=ctx)
-        get_stored_prop.side_effect = [
-            ctx.node.properties.get('serverless_config')
-        ]
-        tasks.install_binary(ctx=ctx)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
 
-        download_call = mock.call(
-            [
-                'curl',
-                '-L',
-                '-o',
-                os.path.join(
-                    ctx.instance.runtime_properties['root_directory'],
-                    'serverless'
-                ),
-                ctx.node.properties['installation_source']
+        def fake_curl(command, *_, **__):
+            with open(command[3], 'w') as outfile:
+                outfile.write('#!/bin/sh')
+
+        run_sub_sdk.side_effect = fake_curl
+        root_dirs = []
+        for instance_id in ['test_sl_012345', 'test_sl_678910']:
+            ctx = self.get_binary_type_mock_ctx()
+            ctx.instance.id = instance_id
+            ctx.node.properties['binary_cache_directory'] = cache_dir
+            current_ctx.set(ctx=ctx)
+            get_stored_prop.side_effect = [
+                ctx.node.properties.get('serverless_config')
             ]
-        )
-        chmod_call = mock.call(
-            [
-                'chmod',
-                'u+x',
-                os.path.join(
-                    ctx.instance.runtime_properties['root_directory'],
-                    'serverless'
-                )
-            ],
-            ctx.logger
-        )
-        run_sub_sdk.assert_has_calls([download_call, chmod_call])
+            root_dir = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, root_dir)
+            ctx.instance.runtime_properties['root_directory'] = root_dir
+            tasks.install_binary(ctx=ctx)
+            root_dirs.append((ctx, root_dir))
+
+        run_sub_sdk.assert_called_once()
+        download_command = run_sub_sdk.call_args[0][0]
+        self.assertEqual(download_command[:3], ['curl', '-L', '-o'])
+        self.assertTrue(download_command[3].startswith(cache_dir))
+        self.assertEqual(
+            download_command[4], ctx.node.properties['installation_source'])
+        for ctx, root_dir in root_dirs:
+            executable_path = os.path.join(root_dir, 'serverless')
+            self.assertEqual(
+                ctx.instance.runtime_properties['executable_path'],
+                executable_path)
+            self.assertTrue(os.access(executable_path, os.X_OK))
+
+    @_test_wrapper
+    @mock.patch('cloudify_common_sdk.utils.run_subprocess')
+    @mock.patch('serverless_plugin.utils.get_stored_property')
+    @mock.patch('serverless_sdk.Serverless._execute')
+    def test_install_binary_zip(self,
+                                run_sub,
+                                get_stored_prop,
+                                run_sub_sdk,
+                                *_, **__):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+
+        def fake_curl(command, *_, **__):
+            with zipfile.ZipFile(command[3], 'w') as archive:
+                archive.writestr('README.md', 'read me')
+                archive.writestr('serverless/serverless', '#!/bin/sh')
+
+        run_sub_sdk.side_effect = fake_curl
+        for _ in range(2):
+            ctx = self.get_binary_type_mock_ctx()
+            ctx.node.properties['installation_source'] = \
+                'https://example.com/serverless-linux-x64.zip'
+            ctx.node.properties['binary_cache_directory'] = cache_dir
+            current_ctx.set(ctx=ctx)
+            get_stored_prop.side_effect = [
+                ctx.node.properties.get('serverless_config')
+            ]
+            root_dir = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, root_dir)
+            ctx.instance.runtime_properties['root_directory'] = root_dir
+            tasks.install_binary(ctx=ctx)
+            executable_path = os.path.join(root_dir, 'serverless')
+            with open(executable_path) as binary:
+                self.assertEqual(binary.read(), '#!/bin/sh')
+            self.assertTrue(os.access(executable_path, os.X_OK))
+        run_sub_sdk.assert_called_once()
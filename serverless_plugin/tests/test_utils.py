@@ -106,3 +106,37 @@ class ServerlessUtilsTestBase(unittest.TestCase):
                     'executable_path': test_file.name
                 }
             )
+
+    def test_verify_executable_cached(self):
+        with tempfile.NamedTemporaryFile() as test_file:
+            os.chmod(test_file.name, 0o0770)
+            mock_node = mock.Mock(type_hierarchy=utils.BINARY_TYPE)
+            mock_instance = mock.Mock(
+                runtime_properties={
+                    'executable_path': test_file.name,
+                }
+            )
+            mock_target = mock.Mock(node=mock_node, instance=mock_instance)
+            relationships = mock.PropertyMock(
+                return_value=[mock.Mock(target=mock_target)])
+            node_instance = mock.Mock(id='test_cached', runtime_properties={})
+            type(node_instance).relationships = relationships
+            with mock.patch('os.access', wraps=os.access) as access:
+                for _ in range(3):
+                    self.assertEqual(
+                        utils.verify_executable({}, node_instance),
+                        {'executable_path': test_file.name})
+                self.assertEqual(relationships.call_count, 1)
+                self.assertEqual(access.call_count, 1)
+                os.chmod(test_file.name, 0o0750)
+                utils.verify_executable({}, node_instance)
+                utils.verify_executable({'executable_path': test_file.name})
+                self.assertEqual(relationships.call_count, 1)
+                self.assertEqual(access.call_count, 2)
+            os.chmod(test_file.name, 0o0640)
+            self.assertRaisesRegex(
+                NonRecoverableError,
+                r'the file is not executable',
+                utils.verify_executable,
+                {},
+                node_instance)
@@ -0,0 +1,135 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import mock
+from cloudify.exceptions import NonRecoverableError, RecoverableError
+from cloudify.workflows.tasks import HandlerResult
+
+from .. import workflows
+
+
+class WorkflowsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lanes = []
+        self.runtime_properties = {}
+
+    def _instance(self, node_id, instance_id):
+        instance = mock.Mock(id=instance_id, node_id=node_id)
+        instance.execute_operation.return_value = mock.Mock(
+            name=instance_id,
+            async_result=mock.Mock(result=None),
+            total_retries=3,
+            current_retries=0,
+            on_failure=None)
+        self.runtime_properties[instance_id] = {
+            'timings': {'start': {'ms': 1500}}}
+        return instance
+
+    def _subgraph(self, name):
+        lane, tasks = mock.Mock(name=name), []
+        lane.sequence.return_value.add.side_effect = \
+            lambda *added: tasks.extend(added)
+        self.lanes.append((name, tasks))
+        return lane
+
+    def _ctx(self, failed=None):
+        services = [
+            mock.Mock(
+                id='service_{}'.format(n),
+                type_hierarchy=['cloudify.nodes.Root',
+                                workflows.SERVICE_TYPE],
+                instances=[
+                    self._instance(
+                        'service_{}'.format(n), 'service_{}_{}'.format(n, i))
+                    for i in range(3)
+                ])
+            for n in range(2)
+        ]
+        binary = mock.Mock(
+            id='binary',
+            type_hierarchy=['cloudify.nodes.Root',
+                            'cloudify.nodes.serverless.Binary'],
+            instances=[self._instance('binary', 'binary_1')])
+        ctx = mock.Mock(nodes=[binary] + services)
+        graph = ctx.graph_mode.return_value
+        graph.subgraph.side_effect = self._subgraph
+
+        def execute():
+            for _, tasks in self.lanes:
+                for task in tasks:
+                    if task._mock_name == failed:
+                        task.async_result.result = NonRecoverableError('boom')
+                        self.assertEqual(
+                            task.on_failure(task).action,
+                            HandlerResult.HANDLER_IGNORE)
+                        del self.runtime_properties[task._mock_name]
+
+        graph.execute.side_effect = execute
+        ctx.get_node_instance.side_effect = lambda instance_id: mock.Mock(
+            runtime_properties=self.runtime_properties.get(instance_id, {}))
+        return ctx
+
+    def _lane_names(self):
+        return [(name, [task._mock_name for task in tasks])
+                for name, tasks in self.lanes]
+
+    def test_deploy_all(self):
+        ctx = self._ctx()
+        timings = workflows.deploy_all(
+            ctx=ctx, node_ids=['service_0'], max_concurrency=2,
+            max_processes=4)
+        self.assertEqual(
+            timings,
+            {'service_0_0': 1.5, 'service_0_1': 1.5, 'service_0_2': 1.5})
+        self.assertEqual(
+            self._lane_names(),
+            [('deploy_services_0', ['service_0_0', 'service_0_2']),
+             ('deploy_services_1', ['service_0_1'])])
+        ctx.graph_mode.return_value.execute.assert_called_once_with()
+        ctx.refresh_node_instances.assert_called_once_with()
+        binary, service_0, service_1 = ctx.nodes
+        binary.instances[0].execute_operation.assert_not_called()
+        service_1.instances[0].execute_operation.assert_not_called()
+        service_0.instances[0].execute_operation.assert_called_once_with(
+            'cloudify.interfaces.lifecycle.start',
+            kwargs={'max_processes': 4})
+
+    def test_deploy_all_failure(self):
+        ctx = self._ctx(failed='service_1_1')
+        self.assertRaisesRegex(
+            NonRecoverableError,
+            'Failed to deploy services: service_1_1: boom',
+            workflows.deploy_all,
+            ctx=ctx)
+        self.assertEqual(len(self.lanes), 6)
+
+    def test_on_failure(self):
+        failures = {}
+        handler = workflows._on_failure('service_0_0', failures)
+        task = mock.Mock(
+            async_result=mock.Mock(
+                result=RecoverableError('throttled', retry_after=5)),
+            total_retries=3,
+            current_retries=1)
+        result = handler(task)
+        self.assertEqual(result.action, HandlerResult.HANDLER_RETRY)
+        self.assertEqual(result.retry_after, 5)
+        self.assertEqual(failures, {})
+        task.current_retries = 3
+        self.assertEqual(
+            handler(task).action, HandlerResult.HANDLER_IGNORE)
+        self.assertEqual(list(failures), ['service_0_0'])
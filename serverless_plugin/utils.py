@@ -14,12 +14,8 @@
 import os
 import sys
 
-from cloudify.utils import exception_to_error_cause
 from cloudify.exceptions import NonRecoverableError
-from cloudify_common_sdk.utils import get_node_instance_dir
-from cloudify_common_sdk.secure_property_management import get_stored_property
-
-from serverless_sdk import Serverless
+from serverless_sdk.timing import timed
 
 SL_CONFIG = 'serverless_config'
 SERVERLESS_PARAMS = [
@@ -31,7 +27,22 @@ ROOT_DIR = 'root_directory'
 BINARY_TYPE = 'cloudify.nodes.serverless.Binary'
 
 
+# cloudify_common_sdk.utils is slow to import, and most of it is not needed
+# to run an operation, so the helpers below import it on first use.
+def get_node_instance_dir(*args, **kwargs):
+    from cloudify_common_sdk.utils import get_node_instance_dir
+    return get_node_instance_dir(*args, **kwargs)
+
+
+def get_stored_property(*args, **kwargs):
+    from cloudify_common_sdk.secure_property_management import \
+        get_stored_property
+    return get_stored_property(*args, **kwargs)
+
+
 def initialize_serverless(_ctx):
+    from serverless_sdk import Serverless
+
     params = dict(
         deployment_name=_ctx.deployment.id,
         node_instance_name=_ctx.instance.id,
@@ -41,11 +52,13 @@ def initialize_serverless(_ctx):
         _ctx.instance.runtime_properties[ROOT_DIR] = get_node_instance_dir()
     params[ROOT_DIR] = _ctx.instance.runtime_properties[ROOT_DIR]
     if BINARY_TYPE not in _ctx.node.type_hierarchy:
-        for key in SERVERLESS_PARAMS:
-            params[key] = get_stored_property(_ctx, key)
+        with timed('properties'):
+            for key in SERVERLESS_PARAMS:
+                params[key] = get_stored_property(_ctx, key)
     else:
         if SL_CONFIG not in params:
-            params[SL_CONFIG] = get_stored_property(_ctx, SL_CONFIG)
+            with timed('properties'):
+                params[SL_CONFIG] = get_stored_property(_ctx, SL_CONFIG)
         if not _ctx.node.properties['use_external_resource'] and \
                 params[SL_CONFIG].get('executable_path') and \
                 _ctx.workflow_id == 'install':
@@ -56,11 +69,33 @@ def initialize_serverless(_ctx):
                 ))
         elif _ctx.workflow_id == 'install':
             return Serverless(**params)
-    params[SL_CONFIG] = verify_executable(
-        params[SL_CONFIG], _ctx.instance)
+    with timed('verify_executable'):
+        params[SL_CONFIG] = verify_executable(
+            params[SL_CONFIG], _ctx.instance)
     return Serverless(**params)
 
 
+# Executables that were validated by this process, by path, with the
+# (inode, mtime, mode) they had at the time.
+_VALID_EXECUTABLES = {}
+
+
+def _executable_stat(file_path):
+    try:
+        stat = os.stat(file_path)
+    except (TypeError, OSError):
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_mode
+
+
+def _is_valid_executable_cached(file_path):
+    stat = _executable_stat(file_path)
+    if stat and _VALID_EXECUTABLES.get(file_path) == stat:
+        return True
+    _VALID_EXECUTABLES.pop(file_path, None)
+    return False
+
+
 def verify_executable(config, node_instance=None):
     executable_from_config = config.get('executable_path')
     if validate_executable_file(executable_from_config):
@@ -87,6 +122,8 @@ def verify_executable(config, node_instance=None):
 def validate_executable_file(file_path):
     if not file_path:
         return False
+    if _is_valid_executable_cached(file_path):
+        return True
     if not os.path.exists(file_path):
         raise NonRecoverableError(
             'Executable file_path {} was provided, '
@@ -95,6 +132,7 @@ def validate_executable_file(file_path):
         raise NonRecoverableError(
             'Executable file_path {} was provided, '
             'but the file is not executable.'.format(file_path))
+    _VALID_EXECUTABLES[file_path] = _executable_stat(file_path)
     return True
 
 
@@ -104,6 +142,7 @@ def find_rels_by_node_type(node_instance, node_type):
 
 
 def generate_traceback_exception():
+    from cloudify.utils import exception_to_error_cause
     _, exc_value, exc_traceback = sys.exc_info()
     response = exception_to_error_cause(exc_value, exc_traceback)
     return response
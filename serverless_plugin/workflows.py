@@ -0,0 +1,122 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from cloudify.decorators import workflow
+from cloudify.exceptions import NonRecoverableError, RecoverableError
+from cloudify.workflows.tasks import HandlerResult
+
+from .decorators import TIMINGS
+
+SERVICE_TYPE = 'cloudify.nodes.serverless.Service'
+START_OPERATION = 'cloudify.interfaces.lifecycle.start'
+DEFAULT_MAX_CONCURRENCY = 10
+
+
+def _service_instances(ctx, node_ids=None, node_instance_ids=None):
+    for node in ctx.nodes:
+        if SERVICE_TYPE not in node.type_hierarchy:
+            continue
+        if node_ids and node.id not in node_ids:
+            continue
+        for instance in node.instances:
+            if node_instance_ids and instance.id not in node_instance_ids:
+                continue
+            yield instance
+
+
+def _on_failure(instance_id, failures):
+    """Retry recoverable errors like the default handler does, and let the
+    other services of the lane deploy when a service fails.
+    """
+    def handler(task):
+        error = task.async_result.result
+        if not isinstance(error, NonRecoverableError) and (
+                task.total_retries < 0 or
+                task.current_retries < task.total_retries):
+            result = HandlerResult.retry()
+            if isinstance(error, RecoverableError):
+                result.retry_after = error.retry_after
+            return result
+        failures[instance_id] = error
+        return HandlerResult.ignore()
+    return handler
+
+
+@workflow
+def deploy_all(ctx,
+               node_ids=None,
+               node_instance_ids=None,
+               max_concurrency=None,
+               max_processes=None,
+               **_):
+    """Run the start operation, that deploys the service, of all the
+    serverless Service instances in parallel.
+
+    :param node_ids: only deploy the instances of these nodes.
+    :param node_instance_ids: only deploy these instances.
+    :param max_concurrency: the number of services deployed at a time.
+    :param max_processes: the number of serverless processes that may run
+        at a time on the manager, across all deployments that use it.
+    """
+    instances = list(_service_instances(ctx, node_ids, node_instance_ids))
+    if not instances:
+        ctx.logger.info('There are no serverless services to deploy.')
+        return
+    kwargs = {}
+    if max_processes:
+        kwargs['max_processes'] = max_processes
+    failures = {}
+
+    # Every lane deploys its services one after the other, so that no more
+    # than max_concurrency services deploy at a time.
+    graph = ctx.graph_mode()
+    lanes = [
+        graph.subgraph('deploy_services_{}'.format(index)).sequence()
+        for index in range(
+            min(max_concurrency or DEFAULT_MAX_CONCURRENCY, len(instances)))
+    ]
+    for index, instance in enumerate(instances):
+        task = instance.execute_operation(START_OPERATION, kwargs=kwargs)
+        task.on_failure = _on_failure(instance.id, failures)
+        lanes[index % len(lanes)].add(task)
+    started = time.time()
+    graph.execute()
+    elapsed = time.time() - started
+
+    # The start operation keeps its timings in runtime properties.
+    ctx.refresh_node_instances()
+    timings = {}
+    for instance in instances:
+        runtime_properties = ctx.get_node_instance(
+            instance.id).runtime_properties
+        record = (runtime_properties.get(TIMINGS) or {}).get('start') or {}
+        if record.get('ms') is not None:
+            timings[instance.id] = record['ms'] / 1000.0
+        ctx.logger.info(
+            'Service {} of node {} {} in {} seconds.'.format(
+                instance.id,
+                instance.node_id,
+                'failed' if instance.id in failures else 'deployed',
+                timings.get(instance.id)))
+    ctx.logger.info(
+        'Deployed {} of {} services in {:.3f} seconds.'.format(
+            len(instances) - len(failures), len(instances), elapsed))
+    if failures:
+        raise NonRecoverableError(
+            'Failed to deploy services: {}'.format('; '.join(
+                '{}: {}'.format(instance.id, failures[instance.id])
+                for instance in instances if instance.id in failures)))
+    return timings
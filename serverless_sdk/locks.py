@@ -0,0 +1,198 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+
+from . import CloudifyServerlessSDKError
+
+SLOT_POLL_INTERVAL = 0.2
+
+
+class _PathLock(object):
+    """The readers-writer lock of a lock path within this process, which
+    holds the flock of the path while any thread holds it.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.lock_file = None
+
+    def _flock(self, lock_path, shared):
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(
+                lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        except BaseException:
+            lock_file.close()
+            raise
+        self.lock_file = lock_file
+
+    def _unflock(self):
+        fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+        self.lock_file.close()
+        self.lock_file = None
+
+    def acquire(self, lock_path, shared):
+        # The flock is taken while no other thread holds the lock, so
+        # holding the condition while waiting for it blocks no release.
+        with self.condition:
+            if shared:
+                while self.writer:
+                    self.condition.wait()
+                if not self.readers:
+                    self._flock(lock_path, shared)
+                self.readers += 1
+            else:
+                while self.writer or self.readers:
+                    self.condition.wait()
+                self._flock(lock_path, shared)
+                self.writer = True
+
+    def release(self, shared):
+        with self.condition:
+            if shared:
+                self.readers -= 1
+                if not self.readers:
+                    self._unflock()
+            else:
+                self.writer = False
+                self._unflock()
+            self.condition.notify_all()
+
+
+# The readers-writer locks of this process, by path. flock conflicts
+# between open files of the same process too, so threads wait on these
+# before taking the flock, which is held once for all of them.
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+# The locks that the current thread holds, or was handed by the thread
+# that started it, by path, with whether they are shared.
+_thread_locks = threading.local()
+
+
+def _held():
+    if not hasattr(_thread_locks, 'held'):
+        _thread_locks.held = {}
+    return _thread_locks.held
+
+
+def held_locks():
+    """The locks that the current thread holds, to hand to worker threads
+    with handed_locks.
+    """
+    return dict(_held())
+
+
+@contextmanager
+def handed_locks(locks):
+    """Let the current thread reenter locks that the thread which started
+    it holds, and waits for it with. The locks stay with their owner.
+
+    :param locks: the locks, as returned by held_locks in the owner.
+    """
+    held = _held()
+    handed = {path: shared for path, shared in locks.items()
+              if path not in held}
+    held.update(handed)
+    try:
+        yield
+    finally:
+        for path in handed:
+            held.pop(path, None)
+
+
+@contextmanager
+def file_lock(lock_path, shared=False):
+    """Hold an flock on lock_path, which is created if it is missing.
+    Other processes and threads wait for an exclusive lock, or for a shared
+    lock while an exclusive lock is held. The lock is reentrant for the
+    thread that holds it, and for the worker threads it is handed to.
+
+    :param lock_path: the path of the lock file.
+    :param shared: take a shared lock instead of an exclusive one.
+    """
+    lock_path = os.path.abspath(lock_path)
+    held = _held()
+    if lock_path in held:
+        if held[lock_path] and not shared:
+            raise CloudifyServerlessSDKError(
+                'Cannot take an exclusive lock on {} while a shared lock '
+                'on it is held.'.format(lock_path))
+        yield
+        return
+    with _path_locks_lock:
+        path_lock = _path_locks.setdefault(lock_path, _PathLock())
+    path_lock.acquire(lock_path, shared)
+    held[lock_path] = shared
+    try:
+        yield
+    finally:
+        del held[lock_path]
+        path_lock.release(shared)
+
+
+def try_file_lock(lock_path):
+    """Take an exclusive flock on lock_path without waiting, even for the
+    locks of this process.
+
+    :return: the open lock file, which releases the lock when it is
+        closed, or None if the lock is held.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    lock_file = open(lock_path, 'a')
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        lock_file.close()
+        return None
+    return lock_file
+
+
+@contextmanager
+def slot_lock(directory, slots, poll_interval=SLOT_POLL_INTERVAL):
+    """Hold one of a fixed number of lock files in directory, waiting while
+    all of them are taken. Every process on the host that uses the same
+    directory and number of slots shares the limit, and the slot of a
+    process that dies is released with its file descriptor.
+
+    :param directory: the directory of the slot lock files.
+    :param slots: the number of slots.
+    :param poll_interval: seconds to wait between attempts.
+    :return: the index of the slot.
+    """
+    os.makedirs(directory, exist_ok=True)
+    slots = max(1, int(slots))
+    while True:
+        for index in range(slots):
+            lock_file = open(
+                os.path.join(directory, 'slot-{}.lock'.format(index)), 'a')
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                lock_file.close()
+                continue
+            try:
+                yield index
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                lock_file.close()
+            return
+        time.sleep(poll_interval)
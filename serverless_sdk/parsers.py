@@ -0,0 +1,266 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import time
+from datetime import datetime, timedelta
+
+from . import yaml_utils
+
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+# serverless v3, for example:
+#   Deploying aws-service to stage dev (us-east-1)
+#   Service deployed to stack aws-service-dev (112s)
+DEPLOYING = re.compile(
+    r'Deploying (?P<service>\S+) to stage (?P<stage>\S+) '
+    r'\((?P<region>[^)]+)\)')
+DEPLOYED = re.compile(r'Service deployed to stack (?P<stack>\S+)')
+# serverless v2 prints a "Service Information" section.
+SERVICE_INFORMATION = 'Service Information'
+SECTION_LINE = re.compile(r'^(\s+\S.*|[\w][\w ]*:.*)$')
+SECTION_END = ('Serverless:', 'Stack Outputs')
+# Function entries of v3 end with the size of the package, e.g. (1.5 kB).
+PACKAGE_SIZE = re.compile(r'\s+\([\d.]+\s*[kKMG]?B\)$')
+INFO_KEYS = ['service', 'stage', 'region', 'stack']
+
+
+def _section(lines):
+    """Return the leading lines that look like a YAML mapping."""
+    section = []
+    for line in lines:
+        if not line.strip():
+            if section:
+                break
+            continue
+        if not SECTION_LINE.match(line) or line.startswith(SECTION_END):
+            break
+        section.append(line)
+    return section
+
+
+def _load_section(lines):
+    try:
+        loaded = yaml_utils.safe_load('\n'.join(lines))
+    except yaml_utils.yaml_error():
+        return None
+    return loaded if isinstance(loaded, dict) else None
+
+
+def _lines(text):
+    return ANSI_ESCAPE.sub('', text).splitlines()
+
+
+def parse_service_information(output, errors=None):
+    """Parse the service information that serverless deploy prints, into
+    the same structure that serverless info returns.
+
+    serverless v3 prints the deploy notices to stderr, so both streams are
+    searched, and the service information may follow the notices or start
+    the stdout.
+
+    :param output: the stdout of serverless deploy.
+    :param errors: its stderr, by default the stderr that the output of a
+        command holds.
+    :return: a dict, or None if the output holds no service information.
+    """
+    if not isinstance(output, str):
+        return None
+    if errors is None:
+        errors = getattr(output, 'stderr', None)
+    streams = [_lines(output)]
+    if isinstance(errors, str) and errors != output:
+        streams.append(_lines(errors))
+    info = {}
+    sections = []
+    for lines in streams:
+        for index, line in enumerate(lines):
+            if line.strip() == SERVICE_INFORMATION:
+                sections.append(_section(lines[index + 1:]))
+                break
+            deploying = DEPLOYING.search(line)
+            if deploying:
+                info.update(deploying.groupdict())
+            deployed = DEPLOYED.search(line)
+            if deployed:
+                info['stack'] = deployed.group('stack')
+                sections.append(_section(lines[index + 1:]))
+                break
+        else:
+            if lines is streams[0]:
+                # The notices went to stderr, and stdout holds only the
+                # section.
+                sections.append(_section(lines))
+    for section in sections:
+        info.update(_load_section(section) or {})
+    if any(key not in info for key in INFO_KEYS):
+        return None
+    functions = info.get('functions')
+    if isinstance(functions, dict):
+        info['functions'] = {
+            name: PACKAGE_SIZE.sub('', value) if isinstance(value, str)
+            else value
+            for name, value in functions.items()
+        }
+    return info
+
+
+# serverless metrics prints a block per function, or for the whole service:
+#   hello
+#   January 1, 2:26 PM - January 2, 2:26 PM
+#
+#   Invocations: 12
+#   Throttles: 0
+#   Errors: 0
+#   Duration (avg.): 34.3ms
+METRICS_WINDOW = re.compile(
+    r'^(?P<start>\w+ \d+,.*?)\s+-\s+(?P<end>\w+ \d+,.*)$')
+METRICS_WINDOW_FORMATS = [
+    '%B %d, %Y %I:%M %p', '%b %d, %Y %I:%M %p',
+    '%B %d, %I:%M %p', '%b %d, %I:%M %p',
+]
+METRIC = re.compile(
+    r'^(?P<name>[A-Za-z][A-Za-z ]*?)\s*(?:\((?P<stat>[^)]+)\))?\s*:\s*'
+    r'(?P<value>-?[\d.,]+)\s*(?P<unit>ms|s)?\s*$')
+SERVICE_WIDE = 'service wide'
+METRICS_TIME_KEYS = ['start', 'end']
+
+
+def _metrics_time(text, now):
+    for time_format in METRICS_WINDOW_FORMATS:
+        try:
+            parsed = datetime.strptime(text.strip(), time_format)
+        except ValueError:
+            continue
+        if '%Y' not in time_format:
+            # The CLI leaves the year out, so take the latest one that does
+            # not put the window in the future.
+            parsed = parsed.replace(year=now.year)
+            if parsed > now + timedelta(days=1):
+                parsed = parsed.replace(year=now.year - 1)
+        return int(time.mktime(parsed.timetuple()))
+    return None
+
+
+def _metric(match):
+    name = '_'.join(match.group('name').lower().split())
+    stat = match.group('stat')
+    if stat:
+        name = '{}_{}'.format(name, re.sub(r'\W', '', stat.lower()))
+    value = float(match.group('value').replace(',', ''))
+    if match.group('unit') == 's':
+        value *= 1000
+    if value.is_integer() and not match.group('unit'):
+        value = int(value)
+    return name, value
+
+
+def parse_metrics(output, now=None):
+    """Parse the output of serverless metrics into typed records.
+
+    :param output: the output of serverless metrics.
+    :param now: the current local datetime, to complete the windows, which
+        the CLI prints without a year.
+    :return: a list of dicts with the function, or None for service wide
+        metrics, the start and end of the window in epoch seconds, and the
+        metrics, for example invocations or duration_avg in milliseconds.
+    """
+    if not isinstance(output, str):
+        return []
+    now = now or datetime.now()
+    records = []
+    record = None
+    heading = None
+    for line in ANSI_ESCAPE.sub('', output).splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        window = METRICS_WINDOW.match(line)
+        start = end = None
+        if window:
+            start = _metrics_time(window.group('start'), now)
+            end = _metrics_time(window.group('end'), now)
+        if start is not None and end is not None:
+            function = heading
+            if function and function.lower().startswith(SERVICE_WIDE):
+                function = None
+            record = {'function': function, 'start': start, 'end': end}
+            records.append(record)
+            continue
+        metric = METRIC.match(line)
+        if metric and record is not None:
+            name, value = _metric(metric)
+            record[name] = value
+        else:
+            heading = line
+            record = None
+    return records
+
+
+def metrics_series(records, default_name=None):
+    """Arrange metrics records as parallel arrays, by function, which take
+    much less room in runtime properties than a dict per data point.
+
+    :param records: metrics records, as returned by parse_metrics.
+    :param default_name: the name of service wide records.
+    :return: a dict of function name to a dict of field name to a list of
+        values, sorted by the start of the window. Every list has the same
+        length, and a metric that is missing from a window is None.
+    """
+    series = {}
+    for record in sorted(records, key=lambda r: r['start']):
+        columns = series.setdefault(
+            record['function'] or default_name,
+            {key: [] for key in METRICS_TIME_KEYS})
+        length = len(columns['start'])
+        for key, value in record.items():
+            if key == 'function':
+                continue
+            if key not in columns:
+                columns[key] = [None] * length
+            columns[key].append(value)
+        for values in columns.values():
+            if len(values) == length:
+                values.append(None)
+    return series
+
+
+def append_series(series, new_series, retention=None):
+    """Append the windows of new_series to series, in place, skipping the
+    windows that do not start after the last one in series.
+
+    :param series: the columns of one function, as in metrics_series.
+    :param new_series: columns of the same function to append.
+    :param retention: the number of windows to keep, the oldest are
+        dropped.
+    :return: series.
+    """
+    for key in METRICS_TIME_KEYS:
+        series.setdefault(key, [])
+    length = len(series['start'])
+    last_start = series['start'][-1] if length else None
+    for index, start in enumerate(new_series.get('start', [])):
+        if last_start is not None and start <= last_start:
+            continue
+        for key, values in new_series.items():
+            if key not in series:
+                series[key] = [None] * length
+            series[key].append(values[index])
+        length += 1
+        for values in series.values():
+            if len(values) < length:
+                values.append(None)
+    if retention and length > retention:
+        for key in series:
+            del series[key][:length - retention]
+    return series
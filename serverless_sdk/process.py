@@ -0,0 +1,214 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import signal
+import threading
+import subprocess
+from collections import deque
+
+from . import CloudifyServerlessSDKError
+
+DEFAULT_BUFFER_LINES = 10000
+MAX_LINE_BYTES = 64 * 1024
+ERROR_TAIL_LINES = 20
+KILL_GRACE_PERIOD = 10
+
+
+class CloudifyServerlessProcessError(CloudifyServerlessSDKError):
+
+    def __init__(self, command, exit_code, stdout, stderr, timed_out=False):
+        self.command = command
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        if timed_out:
+            reason = 'timed out'
+        else:
+            reason = 'failed with exit code {}'.format(exit_code)
+        tail = '\n'.join((stderr or stdout).splitlines()[-ERROR_TAIL_LINES:])
+        super().__init__(
+            'Command {} {}. Output:\n{}'.format(command, reason, tail))
+
+
+def _kill_tree(process):
+    """Kill the process group of process, and any descendant that left it.
+    """
+    try:
+        import psutil
+        descendants = psutil.Process(process.pid).children(recursive=True)
+    except Exception:
+        descendants = []
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except OSError:
+            pass
+        for descendant in descendants:
+            try:
+                descendant.send_signal(sig)
+            except Exception:
+                pass
+        try:
+            process.wait(KILL_GRACE_PERIOD)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+class ProcessOutput(str):
+    """The output of a command, that keeps its stderr apart, as serverless
+    v3 prints its progress and notices to stderr.
+    """
+
+    def __new__(cls, output, stderr=''):
+        value = super(ProcessOutput, cls).__new__(cls, output)
+        value.stderr = stderr
+        return value
+
+
+class StreamingProcess(object):
+    """Run a command and stream its stdout and stderr to the logger line by
+    line, keeping only the last lines of each in memory.
+    """
+
+    def __init__(self,
+                 command,
+                 logger,
+                 cwd=None,
+                 env=None,
+                 timeout=None,
+                 buffer_lines=None,
+                 spill_path=None,
+                 log_stdout=True,
+                 log_stderr=True,
+                 sanitize=None):
+        """
+        :param command: the argv list to run.
+        :param logger: lines are forwarded to it as they arrive.
+        :param cwd: the working directory.
+        :param env: the environment of the process.
+        :param timeout: seconds after which the process tree is killed.
+        :param buffer_lines: how many lines of each stream to keep.
+        :param spill_path: a file to write all of the output to.
+        :param log_stdout: forward stdout lines to the logger.
+        :param log_stderr: forward stderr lines to the logger.
+        :param sanitize: a function that masks secrets in logged lines.
+        """
+        self.command = command
+        self.logger = logger
+        self.cwd = cwd
+        self.env = env
+        self.timeout = timeout or None
+        self.spill_path = spill_path
+        self.log_stdout = log_stdout
+        self.log_stderr = log_stderr
+        self.sanitize = sanitize or (lambda line: line)
+        buffer_lines = buffer_lines or DEFAULT_BUFFER_LINES
+        self.stdout_lines = deque(maxlen=buffer_lines)
+        self.stderr_lines = deque(maxlen=buffer_lines)
+        self._output_bytes = {}
+        self.exit_code = None
+        self.timed_out = False
+        self._spill_lock = threading.Lock()
+        self._spill_file = None
+
+    @property
+    def output_bytes(self):
+        return sum(self._output_bytes.values())
+
+    @property
+    def stdout(self):
+        return '\n'.join(self.stdout_lines)
+
+    @property
+    def stderr(self):
+        return '\n'.join(self.stderr_lines)
+
+    def _read(self, pipe, lines, log, prefix=None):
+        self._output_bytes[prefix] = 0
+        for raw_line in iter(lambda: pipe.readline(MAX_LINE_BYTES), b''):
+            self._output_bytes[prefix] += len(raw_line)
+            line = raw_line.decode('utf-8', 'replace').rstrip('\r\n')
+            lines.append(line)
+            if self._spill_file:
+                with self._spill_lock:
+                    if not self._spill_file.closed:
+                        self._spill_file.write(line + '\n')
+            if log:
+                message = self.sanitize(line)
+                if prefix:
+                    self.logger.error('{}: {}'.format(prefix, message))
+                else:
+                    self.logger.info(message)
+        pipe.close()
+
+    def run(self):
+        """Run the command to completion.
+
+        :return: the buffered stdout, as a ProcessOutput that also holds
+            the buffered stderr.
+        """
+        if self.spill_path:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            self._spill_file = open(self.spill_path, 'w')
+        try:
+            process = subprocess.Popen(
+                self.command,
+                cwd=self.cwd,
+                env=self.env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True)
+            self.logger.debug('Process created, PID: {0}'.format(process.pid))
+            readers = [
+                threading.Thread(
+                    target=self._read,
+                    args=(process.stdout, self.stdout_lines, self.log_stdout)),
+                threading.Thread(
+                    target=self._read,
+                    args=(process.stderr,
+                          self.stderr_lines,
+                          self.log_stderr,
+                          '<err>')),
+            ]
+            for reader in readers:
+                reader.daemon = True
+                reader.start()
+            try:
+                self.exit_code = process.wait(self.timeout)
+            except subprocess.TimeoutExpired:
+                self.timed_out = True
+                self.logger.error(
+                    'Command {} did not finish in {} seconds, '
+                    'killing it.'.format(self.command, self.timeout))
+                _kill_tree(process)
+                self.exit_code = process.returncode
+            for reader in readers:
+                # A descendant that escaped the kill may hold the pipes.
+                reader.join(KILL_GRACE_PERIOD if self.timed_out else None)
+        finally:
+            if self._spill_file:
+                with self._spill_lock:
+                    self._spill_file.close()
+        if self.timed_out or self.exit_code != 0:
+            raise CloudifyServerlessProcessError(
+                self.command,
+                self.exit_code,
+                self.stdout,
+                self.stderr,
+                self.timed_out)
+        return ProcessOutput(self.stdout, self.stderr)
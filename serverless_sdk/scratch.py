@@ -0,0 +1,103 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+
+DEFAULT_MAX_SIZE_MB = 1024
+
+
+def _entry_usage(path):
+    """Return the size in bytes of path and the last time anything under
+    it was accessed or modified.
+    """
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return 0, 0
+    size = stat.st_size
+    last_used = max(stat.st_atime, stat.st_mtime)
+    if os.path.isdir(path) and not os.path.islink(path):
+        for dirpath, dirnames, filenames in os.walk(path):
+            for name in dirnames + filenames:
+                try:
+                    stat = os.lstat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                size += stat.st_size
+                last_used = max(last_used, stat.st_atime, stat.st_mtime)
+    return size, last_used
+
+
+class ScratchDirectory(object):
+    """A temporary directory of a node instance that is kept between
+    commands and operations, so that the caches the CLI and npm keep in
+    TMPDIR stay warm. It is pruned to a size cap, least recently used
+    entries first.
+    """
+
+    def __init__(self, path, max_size_mb=None):
+        self.path = path
+        if max_size_mb is None:
+            max_size_mb = DEFAULT_MAX_SIZE_MB
+        self.max_size = int(max_size_mb) * 1024 * 1024
+
+    def ensure(self):
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        return self.path
+
+    def usage(self):
+        """Return a list of (entry path, size, last used) of the top level
+        entries of the directory.
+        """
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            entry_path = os.path.join(self.path, name)
+            entries.append((entry_path,) + _entry_usage(entry_path))
+        return entries
+
+    def prune(self, keep=None):
+        """Remove least recently used entries until the directory fits in
+        its size cap.
+
+        :param keep: a function of an entry path that returns True for
+            entries that must not be removed. They still count towards the
+            size.
+        :return: the list of removed entry paths.
+        """
+        entries = self.usage()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for entry_path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= self.max_size:
+                break
+            if keep and keep(entry_path):
+                continue
+            if os.path.isdir(entry_path) and not os.path.islink(entry_path):
+                shutil.rmtree(entry_path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(entry_path)
+                except OSError:
+                    continue
+            total -= size
+            removed.append(entry_path)
+        return removed
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
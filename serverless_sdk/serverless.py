@@ -0,0 +1,1095 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import json
+import time
+import uuid
+import datetime
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import threading
+from functools import wraps
+from contextlib import ExitStack, contextmanager
+from urllib.parse import urlparse
+
+from cloudify_common_sdk.cli_tool_base import CliTool
+
+from . import yaml_utils
+from . import CloudifyServerlessSDKError, CloudifyServerlessBatchError
+from .locks import file_lock, slot_lock, try_file_lock
+from .process import StreamingProcess
+from .scratch import ScratchDirectory
+from .throttle import Backoff, run_adaptively
+from .timing import record_command
+from .tracing import trace_path, write_trace
+from .store import ContentStore
+from .utils import atomic_write, sha256_file
+
+
+def _hash_state(state):
+    return hashlib.sha256(
+        json.dumps(state, sort_keys=True, default=str).encode(
+            'utf-8')).hexdigest()
+
+
+def _extract_binary(archive_path, name, target):
+    """Extract the top most file called name of a zip archive to target."""
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [
+            member for member in archive.namelist()
+            if os.path.basename(member) == name and not member.endswith('/')
+        ]
+        if not members:
+            raise CloudifyServerlessSDKError(
+                'The archive does not contain {}.'.format(name))
+        member = min(members, key=lambda m: (m.count('/'), m))
+        with archive.open(member) as infile, open(target, 'wb') as outfile:
+            shutil.copyfileobj(infile, outfile)
+
+
+def _iso_time(timestamp):
+    return datetime.datetime.fromtimestamp(
+        int(timestamp), datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+@contextmanager
+def _no_lock():
+    # contextlib.nullcontext needs python 3.7.
+    yield
+
+
+def with_service_lock(shared=False):
+    """Run the method under the service directory lock, shared by
+    readers, and exclusive for methods that change the service.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.service_lock(shared=shared):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+BINARY_CACHE_DIRECTORY = os.path.join(
+    os.path.expanduser('~'), '.cloudify-serverless', 'binaries')
+
+PROCESS_LOCK_DIRECTORY = os.path.join(
+    os.path.expanduser('~'), '.cloudify-serverless', 'processes')
+BINARY_LOCK_DIRECTORY = os.path.join(
+    os.path.expanduser('~'), '.cloudify-serverless', 'locks')
+
+SPILL_DIRECTORY = '.logs'
+TRACE_DIRECTORY = '.traces'
+DEFAULT_ARTIFACT_CACHE_MAX_SIZE_MB = 4096
+
+SERVICE_CONFIG_MAP = {
+    'name': '--name',
+    'template': '--template',
+    'template_url': '--template-url',
+    'template_path': '--template-path',
+    'path': '--path'
+}
+
+
+class Serverless(CliTool):
+    """
+    This is an interface for handling running and configuring
+    Serverless in different providers
+    """
+
+    def __init__(self,
+                 logger,
+                 deployment_name,
+                 node_instance_name,
+                 client_config=None,
+                 resource_config=None,
+                 serverless_config=None,
+                 root_directory=None,
+                 ):
+
+        self._tool_name = 'serverless'
+        super().__init__(logger, deployment_name, node_instance_name)
+        self._client_config = client_config or {}
+        self._resource_config = resource_config or {}
+        self._serverless_config = serverless_config or {}
+        self._root_directory = root_directory
+        self._serverless_config_path = None
+        self._additional_args = {
+            'env': {}
+        }
+        self._scratch = None
+        self._tempenv_lock = threading.RLock()
+        self._log_stdout = True
+
+    @property
+    def additional_args(self):
+        return self._additional_args
+
+    @property
+    def client_config(self):
+        return self._client_config
+
+    @property
+    def resource_config(self):
+        return self._resource_config
+
+    @property
+    def serverless_config(self):
+        return self._serverless_config
+
+    @property
+    def root_directory(self):
+        return self._root_directory
+
+    @additional_args.setter
+    def additional_args(self, value):
+        self._additional_args = value
+
+    @client_config.setter
+    def client_config(self, value):
+        self._client_config = value
+
+    @resource_config.setter
+    def resource_config(self, value):
+        self._resource_config = value
+
+    @serverless_config.setter
+    def serverless_config(self, value):
+        self._serverless_config = value
+
+    @root_directory.setter
+    def root_directory(self, value):
+        self._root_directory = value
+
+    @property
+    def provider(self):
+        return self.client_config.get('provider')
+
+    @property
+    def credentials(self):
+        return self.client_config.get('credentials')
+
+    @property
+    def credentials_digest(self):
+        """A hash of the credentials, so that the deploy state notices that
+        they changed without ever holding the secret values.
+        """
+        credentials = self.credentials or {}
+        if isinstance(credentials, dict):
+            credentials = {
+                key: getattr(value, 'secret', value)
+                for key, value in credentials.items()
+            }
+        return _hash_state(credentials)
+
+    @property
+    def functions(self):
+        return self.resource_config.get('functions')
+
+    @property
+    def serverless_config_path(self):
+        if not self._serverless_config_path:
+            self._serverless_config_path = os.path.join(
+                self.root_directory, 'serverless.yml')
+        return self._serverless_config_path
+
+    @serverless_config_path.setter
+    def serverless_config_path(self, value):
+        self._serverless_config_path = value
+
+    @property
+    def scratch(self):
+        """The scratch directory of the node instance. It is placed under
+        the scratch_directory of the serverless config, which may be a tmpfs,
+        or else next to the instance directory, outside of what serverless
+        packages.
+        """
+        if not self._scratch:
+            base = self.serverless_config.get('scratch_directory')
+            if base:
+                path = os.path.join(
+                    base, self._deployment_name, self._node_instance_name)
+            elif self.root_directory:
+                path = self._beside_root_directory('.scratch')
+            else:
+                path = os.path.join(
+                    tempfile.gettempdir(),
+                    'cloudify-serverless',
+                    self._deployment_name,
+                    self._node_instance_name)
+            self._scratch = ScratchDirectory(
+                path, self.serverless_config.get('scratch_max_size'))
+        return self._scratch
+
+    def _beside_root_directory(self, kind, suffix=''):
+        """A path for files of the instance that are kept next to its
+        directory, so that serverless does not package them.
+        """
+        root_directory = os.path.normpath(self.root_directory)
+        return os.path.join(
+            os.path.dirname(root_directory),
+            kind,
+            os.path.basename(root_directory) + suffix)
+
+    def service_lock(self, shared=False):
+        """Lock the service directory against other processes. Commands
+        that only read the service take it shared, and the ones that change
+        the directory or the deployed service take it exclusively.
+        """
+        if not self.root_directory:
+            return _no_lock()
+        return file_lock(
+            self._beside_root_directory('.locks', '.lock'), shared=shared)
+
+    @contextmanager
+    def binary_lock(self, executable_path=None, shared=False):
+        """Lock an executable against other processes. Running it takes
+        the lock shared, and replacing it takes the lock exclusively.
+        The lock is keyed by the device and inode of the file, so instances
+        whose binaries are symbolic or hard links to the same file, like
+        those of the binary cache, share a lock. An executable that does
+        not exist yet is keyed by its resolved path.
+
+        The lock files are kept in binary_lock_directory of the serverless
+        config. The lock file of a replaced executable that had no other
+        links is removed, as nothing can take it again.
+        """
+        path = os.path.realpath(executable_path or self.executable_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+            key = path
+        else:
+            key = '{}:{}'.format(stat.st_dev, stat.st_ino)
+        lock_path = os.path.join(
+            self.serverless_config.get('binary_lock_directory') or
+            BINARY_LOCK_DIRECTORY,
+            hashlib.sha256(key.encode('utf-8')).hexdigest() + '.lock')
+        with file_lock(lock_path, shared=shared):
+            yield
+            if shared:
+                return
+            try:
+                current = os.stat(path)
+            except OSError:
+                current = None
+            if stat is None:
+                replaced = current is not None
+            else:
+                replaced = stat.st_nlink == 1 and (
+                    current is None or current.st_ino != stat.st_ino)
+            if replaced:
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+
+    @property
+    def tempenv(self):
+        with self._tempenv_lock:
+            return self.scratch.ensure()
+
+    @property
+    def executable_path(self):
+        if not self._executable_path:
+            self._executable_path = self.serverless_config.get(
+                'executable_path')
+        return self._executable_path
+
+    @executable_path.setter
+    def executable_path(self, value):
+        self._executable_path = value
+
+    @property
+    def options(self):
+        options = []
+        for key, value in self.resource_config.items():
+            if value:
+                if key not in SERVICE_CONFIG_MAP:
+                    self.logger.error(
+                        'Resource config key {} is not valid. '
+                        'Ignoring...'.format(key))
+                    continue
+                option = SERVICE_CONFIG_MAP.get(key)
+                options.append(option)
+                options.append(value)
+        return options
+
+    def _command(self, command):
+        if not isinstance(command, list):
+            raise ValueError(
+                'Improper parameter command "{}", '
+                'value should be a list, it is a {}'.format(
+                    command, type(command)))
+        exe_cmd = [self.executable_path]
+        exe_cmd.extend(command)
+        return exe_cmd
+
+    def _subcommand(self, subcommand, options=None, cwd=None):
+        options = options or []
+        cmd = [subcommand]
+        if options:
+            cmd.extend(options)
+        cmd = self._command(cmd)
+        return self.execute(cmd, cwd=cwd)
+
+    @property
+    def create_options(self):
+        options = []
+        for key, value in self.resource_config.items():
+            if key in ['functions', 'env', 'targets']:
+                continue
+            if value:
+                option = SERVICE_CONFIG_MAP.get(key)
+                options.append(option)
+                options.append(value)
+                if option == 'name':
+                    options.append(['--path', value])
+        return options
+
+    def create(self):
+        return self._subcommand('create', self.create_options)
+
+    def aws_warn(self):
+        if self.provider == 'aws':
+            self.logger.info('Provider "aws" was provided. '
+                             'The default behavior for serverless is to '
+                             'modify the ~/.aws profiles. However, since '
+                             'Cloudify is a shared system, this is not '
+                             'possible. The key and secret that were provided '
+                             'will be used in environment variables.')
+
+    @with_service_lock()
+    def configure(self):
+        """Merge the functions into serverless.yml.
+
+        The file is only written if the merged config differs from what is
+        on disk, and then it is replaced atomically.
+
+        :return: True if serverless.yml was changed.
+        """
+        self.aws_warn()
+        try:
+            with open(self.serverless_config_path, 'r') as yaml_file:
+                serverless_config = yaml_file.read()
+        except (IOError, OSError):
+            serverless_config = None
+        config = yaml_utils.safe_load(serverless_config or '') or {}
+        functions = []
+        # Handling functions configurations
+        for function in self.functions:
+            function_name = function['name']
+            fn_config = {
+                key: value for key, value in function.items()
+                if key not in ['path', 'name']
+            }
+            functions.append({function_name: fn_config})
+        config['functions'] = functions
+        rendered = yaml_utils.safe_dump(config, default_flow_style=False)
+        if rendered == serverless_config:
+            self.logger.debug('{} is up to date.'.format(
+                self.serverless_config_path))
+            return False
+        atomic_write(self.serverless_config_path, rendered)
+        return True
+
+    @property
+    def handler_paths(self):
+        """The local handler file of every function, by function name."""
+        return {
+            function['name']: os.path.join(
+                self.root_directory, os.path.basename(function['path']))
+            for function in self.functions or [] if function.get('path')
+        }
+
+    @property
+    def executable_version(self):
+        """Identify the CLI build by its file, so that no process has to be
+        spawned only to ask for its version. The path is left out, so that
+        instances that link the same binary agree on the version.
+        """
+        try:
+            stat = os.stat(os.path.realpath(self.executable_path))
+        except (TypeError, OSError):
+            return [self.executable_path]
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _rendered_config(self):
+        """Split the rendered serverless.yml into the service level config
+        and the config of every function, by function name.
+        """
+        try:
+            with open(self.serverless_config_path, 'r') as yaml_file:
+                config = yaml_utils.safe_load(yaml_file.read()) or {}
+        except (IOError, OSError, yaml_utils.yaml_error()):
+            config = {}
+        functions = config.pop('functions', None) or {}
+        if isinstance(functions, list):
+            merged = {}
+            for function in functions:
+                merged.update(function)
+            functions = merged
+        return config, functions
+
+    @with_service_lock(shared=True)
+    def deploy_state(self):
+        """Hash everything that affects the result of a deploy.
+
+        :return: a dict with the hash of the service level state, which
+            includes the config of every function, IAM, the env, the
+            credentials and the CLI version, and the hash of the code of
+            every function, by function name. deploy function only updates
+            the code and config of the function itself, not the resources
+            CloudFormation manages, so any change of config needs a full
+            deploy.
+        """
+        config, functions = self._rendered_config()
+        handler_paths = self.handler_paths
+        for name in handler_paths:
+            functions.setdefault(name, {})
+        service = {
+            'config': config,
+            'functions': functions,
+            'env': self.resource_config.get('env') or {},
+            'provider': self.provider,
+            'credentials': self.credentials_digest,
+            'executable': self.executable_version,
+        }
+        return {
+            'service': _hash_state(service),
+            'functions': {
+                name: _hash_state({
+                    'code': sha256_file(handler_paths.get(name)),
+                })
+                for name in functions
+            }
+        }
+
+    def fingerprint(self, state=None):
+        """Hash the whole deploy state: the rendered serverless.yml,
+        the handler contents, the env and the CLI version.
+        """
+        return _hash_state(state or self.deploy_state())
+
+    @staticmethod
+    def changed_functions(previous_state, current_state):
+        """Return the functions whose code or config changed, or None if
+        the service level state changed and a full deploy is required.
+        """
+        if not previous_state or \
+                previous_state.get('service') != current_state['service'] \
+                or set(previous_state.get('functions', {})) != \
+                set(current_state['functions']):
+            return None
+        return [name for name, digest in current_state['functions'].items()
+                if previous_state['functions'][name] != digest]
+
+    @with_service_lock(shared=True)
+    def info(self, target=None):
+        return yaml_utils.safe_load(
+            self._subcommand(
+                'info',
+                options=self.target_options(target),
+                cwd=self.root_directory))
+
+    @with_service_lock(shared=True)
+    def invoke(self, name):
+        return self._subcommand(
+            'invoke',
+            options=[
+                '--function',
+                name
+            ],
+            cwd=self.root_directory)
+
+    @with_service_lock(shared=True)
+    def metrics(self, function_name=None, start_time=None, end_time=None):
+        """Get the metrics of a function, or of the whole service.
+
+        :param function_name: the function, or None for the whole service.
+        :param start_time: the start of the window, in epoch seconds.
+        :param end_time: the end of the window, in epoch seconds.
+        """
+        if function_name:
+            options = ['--function', function_name]
+        else:
+            options = []
+        for option, timestamp in (('--startTime', start_time),
+                                  ('--endTime', end_time)):
+            if timestamp is not None:
+                options.extend([option, _iso_time(timestamp)])
+        return self._subcommand(
+            'metrics',
+            options=options,
+            cwd=self.root_directory)
+
+    @property
+    def artifact_cache_directory(self):
+        return self.serverless_config.get('artifact_cache_directory')
+
+    def prune_artifact_cache(self, artifacts=()):
+        """Evict the least recently used packages until the artifact cache
+        fits in artifact_cache_max_size. artifacts, packages that are being
+        written or deployed from, which hold their lock, and the lock files
+        are kept.
+
+        :param artifacts: the paths of packages to keep.
+        """
+        cache = ScratchDirectory(
+            self.artifact_cache_directory,
+            self.serverless_config.get('artifact_cache_max_size') or
+            DEFAULT_ARTIFACT_CACHE_MAX_SIZE_MB)
+        artifacts = set(artifacts)
+        evicting = []
+
+        def keep(path):
+            name = os.path.basename(path)
+            if path in artifacts or name.endswith('.lock') or \
+                    name.startswith('.tmp-'):
+                return True
+            # The package is evicted while its lock is held, so that no
+            # deploy starts from it meanwhile.
+            lock_file = try_file_lock(path + '.lock')
+            if lock_file is None:
+                return True
+            evicting.append(lock_file)
+            return False
+
+        try:
+            for path in cache.prune(keep):
+                self.logger.debug(
+                    'Evicted {} from the artifact cache.'.format(path))
+        finally:
+            for lock_file in evicting:
+                lock_file.close()
+
+    @property
+    def trace_path(self):
+        """The trace file of the deployment, shared by all of its node
+        instances, or None if tracing is off.
+        """
+        trace_format = self.serverless_config.get('trace_format')
+        if not trace_format:
+            return None
+        directory = self.serverless_config.get('trace_directory') or \
+            os.path.join(
+                os.path.dirname(os.path.normpath(self.root_directory)),
+                TRACE_DIRECTORY)
+        return trace_path(directory, self._deployment_name, trace_format)
+
+    def write_trace(self, spans):
+        write_trace(
+            self.trace_path,
+            self.serverless_config.get('trace_format'),
+            spans,
+            self._deployment_name,
+            self._node_instance_name)
+
+    @property
+    def targets(self):
+        """The stages and regions that the service is deployed to, as a
+        list of dicts with stage and region keys, empty for the defaults
+        of serverless.yml.
+        """
+        return self.resource_config.get('targets') or []
+
+    @staticmethod
+    def target_name(target):
+        return '-'.join(
+            target[key] for key in ('stage', 'region') if target.get(key))
+
+    @staticmethod
+    def target_options(target=None):
+        options = []
+        for key in ('stage', 'region'):
+            if (target or {}).get(key):
+                options.extend(['--{}'.format(key), target[key]])
+        return options
+
+    @with_service_lock()
+    def package(self, fingerprint=None, target=None):
+        """Package the service. With an artifact cache, the package is
+        stored there by the fingerprint of the deploy state, and services
+        with the same fingerprint reuse it instead of packaging again.
+
+        :param fingerprint: the fingerprint of the current deploy state.
+        :param target: a dict with the stage and region to package for.
+        :return: the directory of the package.
+        """
+        options = self.target_options(target)
+        if not self.artifact_cache_directory:
+            if not target:
+                self._subcommand('package', cwd=self.root_directory)
+                return os.path.join(self.root_directory, '.serverless')
+            artifact = os.path.join(
+                self._beside_root_directory('.packages'),
+                self.target_name(target))
+            shutil.rmtree(artifact, ignore_errors=True)
+            self._subcommand(
+                'package',
+                options=['--package', artifact] + options,
+                cwd=self.root_directory)
+            return artifact
+        name = fingerprint or self.fingerprint()
+        if target:
+            name = '{}-{}'.format(name, self.target_name(target))
+        artifact = os.path.join(self.artifact_cache_directory, name)
+        with file_lock(artifact + '.lock'):
+            if os.path.isdir(artifact):
+                self.logger.info(
+                    'Using the cached package {}.'.format(artifact))
+                # Mark the package as recently used for eviction.
+                os.utime(artifact)
+                return artifact
+            temp_artifact = os.path.join(
+                self.artifact_cache_directory,
+                '.tmp-{}'.format(uuid.uuid4().hex))
+            try:
+                self._subcommand(
+                    'package',
+                    options=['--package', temp_artifact] + options,
+                    cwd=self.root_directory)
+                os.rename(temp_artifact, artifact)
+            finally:
+                shutil.rmtree(temp_artifact, ignore_errors=True)
+        return artifact
+
+    @contextmanager
+    def packaged(self, fingerprint=None, target=None):
+        """Package the service, and hold the lock of a cached package
+        shared until the block ends, so that it is not evicted while it is
+        deployed from.
+
+        :return: the directory of the package.
+        """
+        if not self.artifact_cache_directory:
+            yield self.package(fingerprint, target)
+            return
+        while True:
+            artifact = self.package(fingerprint, target)
+            with file_lock(artifact + '.lock', shared=True):
+                if os.path.isdir(artifact):
+                    yield artifact
+                    return
+            self.logger.info(
+                'The cached package {} was evicted, packaging again.'.format(
+                    artifact))
+
+    @with_service_lock()
+    def deploy_targets(self, targets, fingerprint=None, max_concurrency=None):
+        """Deploy the service to every target from its own package.
+
+        The compiled CloudFormation template of a package is specific to
+        its stage and region, so every target is packaged, one after the
+        other as they share the service directory, unless its package is
+        cached. The packages are then deployed concurrently.
+
+        :param targets: a list of dicts with stage and region keys.
+        :param fingerprint: the fingerprint of the current deploy state.
+        :param max_concurrency: the number of concurrent deploys.
+        :return: a list of (target, output, error) tuples. A failed target
+            does not stop the others.
+        """
+        fingerprint = fingerprint or self.fingerprint()
+        artifacts = {}
+        outcomes = {}
+
+        def deploy(target):
+            return self._subcommand(
+                'deploy',
+                options=['--package', artifacts[self.target_name(target)]] +
+                self.target_options(target),
+                cwd=self.root_directory)
+
+        with ExitStack() as packages:
+            for target in targets:
+                name = self.target_name(target)
+                try:
+                    artifacts[name] = packages.enter_context(
+                        self.packaged(fingerprint, target))
+                except Exception as error:
+                    outcomes[name] = (target, None, error)
+            if self.artifact_cache_directory:
+                self.prune_artifact_cache(artifacts.values())
+            packaged = [
+                t for t in targets if self.target_name(t) in artifacts]
+            for outcome in self.run_concurrently(
+                    deploy, packaged, max_concurrency):
+                outcomes[self.target_name(outcome[0])] = outcome
+        return [outcomes[self.target_name(target)] for target in targets]
+
+    @with_service_lock()
+    def deploy(self,
+               previous_state=None,
+               current_state=None,
+               max_concurrency=None):
+        if previous_state:
+            current_state = current_state or self.deploy_state()
+            changed = self.changed_functions(previous_state, current_state)
+            if changed is not None:
+                return self.deploy_functions(changed, max_concurrency)
+        if self.artifact_cache_directory:
+            with self.packaged(self.fingerprint(current_state)) as artifact:
+                self.prune_artifact_cache([artifact])
+                return self._subcommand(
+                    'deploy',
+                    options=['--package', artifact],
+                    cwd=self.root_directory)
+        return self._subcommand('deploy', cwd=self.root_directory)
+
+    def deploy_function(self, name):
+        return self._subcommand(
+            'deploy',
+            options=[
+                'function',
+                '--function',
+                name
+            ],
+            cwd=self.root_directory)
+
+    def run_concurrently(self, func, items, max_concurrency=None):
+        """Call func for every item concurrently, retrying the calls that
+        the provider throttles, according to the throttling config.
+        """
+        throttling = self.serverless_config.get('throttling') or {}
+        return run_adaptively(
+            func,
+            items,
+            max_concurrency,
+            retries=throttling.get('retries'),
+            backoff=Backoff(throttling.get('backoff_base'),
+                            throttling.get('backoff_cap')),
+            logger=self.logger)
+
+    @with_service_lock()
+    def deploy_functions(self, names, max_concurrency=None):
+        outcomes = self.run_concurrently(
+            self.deploy_function, names, max_concurrency)
+        failures = ['{}: {}'.format(name, error)
+                    for name, _, error in outcomes if error]
+        if failures:
+            raise CloudifyServerlessBatchError(
+                'Failed to deploy functions: {}'.format('; '.join(failures)),
+                outcomes)
+        return {name: result for name, result, _ in outcomes}
+
+    @with_service_lock()
+    def destroy(self, target=None):
+        return self._subcommand(
+            'remove',
+            options=self.target_options(target),
+            cwd=self.root_directory)
+
+    @with_service_lock()
+    def destroy_targets(self, targets, max_concurrency=None):
+        """Remove the service from every target concurrently.
+
+        :return: a list of (target, output, error) tuples.
+        """
+        return self.run_concurrently(self.destroy, targets, max_concurrency)
+
+    def clean(self):
+        # TODO: I'm not sure if we want to be responsible here
+        #  for removing files. although that could be a good idea.
+        # self.execute(['rm', '-rf', self.resource_config.get('path')])
+        # TODO: Delete credentials dir for example .aws, .kube, etc.
+        # self.execute(['rm', '-rf', self.credentials_dir])
+        with self._tempenv_lock:
+            self.scratch.remove()
+
+    def prune_scratch(self):
+        """Prune the scratch directory to its size cap. It walks the whole
+        directory, so it runs once at the end of an operation rather than
+        after every command.
+        """
+        with self._tempenv_lock:
+            for path in self.scratch.prune():
+                self.logger.debug(
+                    'Pruned {} from the scratch directory.'.format(path))
+
+    def credentialize_env(self, env=None):
+        env = env or {}
+        env.update({
+            'TMP': self.tempenv,
+            'TEMP': self.tempenv,
+            'TMPDIR': self.tempenv,
+        })
+        if self.client_config.get('provider') == 'aws':
+            access_key = self.client_config.get(
+                'credentials', {}).get('key')
+            secret_key = self.client_config.get(
+                'credentials', {}).get('secret')
+            env.update(
+                {
+                    'AWS_ACCESS_KEY_ID': access_key,
+                    'AWS_SECRET_ACCESS_KEY': secret_key
+                }
+            )
+        env_from_props = self.resource_config.get('env')
+        if env_from_props:
+            for k, v in env_from_props.items():
+                if k in env:
+                    self.logger.error(
+                        'The environment variable key {} is provided in the '
+                        'resource config. However, it already exists in the '
+                        'current shell. '
+                        'This may have unexpected results.'.format(k))
+                env[k] = v
+        return env
+
+    def execute(self,
+                command,
+                return_output=None,
+                cwd=None,
+                additional_env=None
+                ):
+        return_output = return_output if return_output is not None \
+            else self._log_stdout
+        # Every command gets its own copy of additional_args, so that
+        # concurrent commands do not clash.
+        additional_args = dict(self.additional_args)
+        additional_args['env'] = dict(self.additional_args.get('env', {}))
+        additional_args['log_stdout'] = return_output
+        with self.process_slot(), self.command_lock(command):
+            return self._execute(
+                command,
+                cwd or self.root_directory,
+                env=self.credentialize_env(additional_env),
+                additional_args=additional_args,
+                return_output=return_output)
+
+    def command_lock(self, command):
+        """The executable is locked shared while it runs, so that it is
+        not replaced under the command.
+        """
+        if self.executable_path and command[0] == self.executable_path:
+            return self.binary_lock(shared=True)
+        return _no_lock()
+
+    @contextmanager
+    def process_slot(self):
+        """Wait for one of the max_processes slots that all the instances
+        on this host share, when max_processes is set.
+        """
+        max_processes = self.serverless_config.get('max_processes')
+        if not max_processes:
+            yield
+            return
+        with slot_lock(
+                self.serverless_config.get('process_lock_directory') or
+                PROCESS_LOCK_DIRECTORY,
+                max_processes):
+            yield
+
+    def _command_name(self, command):
+        if len(command) > 1 and command[0] == self.executable_path:
+            return command[1]
+        return os.path.basename(command[0])
+
+    def command_timeout(self, command):
+        """The wall clock timeout of command, from the command_timeouts of
+        serverless_config, by subcommand, with an optional default.
+        """
+        timeouts = self.serverless_config.get('command_timeouts') or {}
+        return timeouts.get(
+            self._command_name(command), timeouts.get('default'))
+
+    def spill_path(self, command):
+        """The log file of command, beside the service directory so that
+        it is never packaged with the service.
+        """
+        if not self.serverless_config.get('spill_output'):
+            return
+        return os.path.join(
+            self._beside_root_directory(SPILL_DIRECTORY),
+            '{}-{}-{}.log'.format(
+                self._command_name(command),
+                time.strftime('%Y%m%d%H%M%S'),
+                uuid.uuid4().hex[:8]))
+
+    def _execute(self,
+                 command,
+                 cwd,
+                 env,
+                 additional_args=None,
+                 return_output=True):
+        additional_args = additional_args or {}
+        process_env = dict(os.environ)
+        process_env.update(additional_args.get('env') or {})
+        process_env.update(env or {})
+        # Secrets from get_secret are resolved only here.
+        process_env = {
+            key: str(getattr(value, 'secret', value))
+            for key, value in process_env.items() if value is not None
+        }
+        process = StreamingProcess(
+            command,
+            self.logger,
+            cwd=cwd,
+            env=process_env,
+            timeout=self.command_timeout(command),
+            buffer_lines=self.serverless_config.get('output_buffer_lines'),
+            spill_path=self.spill_path(command),
+            log_stdout=additional_args.get('log_stdout', return_output),
+            log_stderr=additional_args.get('log_stderr', True),
+            sanitize=self.sanitize_logs)
+        start = time.perf_counter()
+        try:
+            return process.run()
+        finally:
+            record_command(
+                command,
+                process.exit_code,
+                time.perf_counter() - start,
+                process.output_bytes)
+
+    def install_binary_from_cache(self,
+                                  source,
+                                  executable_path,
+                                  cache_directory=None,
+                                  checksum=None):
+        """Place the binary from source at executable_path, downloading it
+        into a cache shared by all instances only if it is not there yet.
+        A zip source is unpacked, and the file of the name of the executable
+        in it is placed.
+
+        :param source: the URL of the binary, or of a zip archive.
+        :param executable_path: where to place the binary.
+        :param cache_directory: the shared cache directory.
+        :param checksum: the expected sha256 of what source downloads.
+        """
+        store = ContentStore(cache_directory or BINARY_CACHE_DIRECTORY)
+        source_index = os.path.join(
+            store.directory,
+            'sources',
+            hashlib.sha256(source.encode('utf-8')).hexdigest())
+        # Concurrent installs of the same source wait for one download.
+        with file_lock(source_index + '.lock'):
+            digest = checksum
+            if not store.contains(digest) and os.path.exists(source_index):
+                # The index holds the digest of the binary, followed by the
+                # digest of the archive for zip sources.
+                with open(source_index, 'r') as index_file:
+                    digests = index_file.read().split() or [None]
+                digest = digests[0]
+                if checksum and digests[-1] != checksum:
+                    digest = None
+            if store.contains(digest):
+                self.logger.debug(
+                    'Using cached binary {} for {}.'.format(digest, source))
+            else:
+                temp_path = store.temp_path()
+                binary_path = temp_path
+                try:
+                    self.download_tool(source, temp_path)
+                    source_digest = sha256_file(temp_path)
+                    if checksum and source_digest != checksum:
+                        raise CloudifyServerlessSDKError(
+                            'The checksum of {} is {}, expected {}.'.format(
+                                source, source_digest, checksum))
+                    if urlparse(source).path.endswith('.zip'):
+                        binary_path = store.temp_path()
+                        _extract_binary(
+                            temp_path,
+                            os.path.basename(executable_path),
+                            binary_path)
+                    os.chmod(binary_path, 0o755)
+                    digest = store.add(binary_path)
+                finally:
+                    for path in {temp_path, binary_path}:
+                        if os.path.exists(path):
+                            os.remove(path)
+                with open(source_index, 'w') as index_file:
+                    index_file.write(
+                        digest if digest == source_digest
+                        else '{} {}'.format(digest, source_digest))
+        store.link(digest, executable_path)
+        self.executable_path = executable_path
+        return executable_path
+
+    def npm_options(self, cache=None, offline=False):
+        options = []
+        if cache:
+            options.extend(['--cache', cache])
+        if offline:
+            options.append('--offline')
+        return options
+
+    @with_service_lock()
+    def install_with_npm(self,
+                         package=None,
+                         shared_prefix=None,
+                         cache=None,
+                         offline=False):
+        """Install serverless with npm.
+
+        :param package: the npm package spec, or the path of a local
+            tarball, defaults to serverless.
+        :param shared_prefix: install once per package spec, or per content
+            of a local tarball, into a prefix under this directory, and
+            symlink the executable into the instance directory.
+        :param cache: an npm cache directory, which may be pre-populated.
+        :param offline: resolve packages from the npm cache only.
+        """
+        package = package or 'serverless'
+        options = self.npm_options(cache, offline)
+        executable_path = os.path.join(
+            self.root_directory, 'bin', 'serverless')
+        if not shared_prefix:
+            command = 'npm install --prefix {} -g'.format(
+                self.root_directory).split() + options + [package]
+            # npm replaces the package file by file, so commands that
+            # run the old binary have to finish first.
+            with self.binary_lock(executable_path):
+                self.execute(command, cwd=self.root_directory)
+            self.executable_path = executable_path
+            return
+        # Specs or tarballs of the same name may differ, so the prefix is
+        # keyed by the contents of a local tarball, or by the full spec.
+        if os.path.isfile(package):
+            digest = sha256_file(package)
+        else:
+            digest = hashlib.sha256(package.encode('utf-8')).hexdigest()
+        prefix = os.path.join(
+            shared_prefix,
+            '{}-{}'.format(
+                re.sub(r'[^\w.@-]', '_', os.path.basename(package)),
+                digest[:16]))
+        shared_executable = os.path.join(prefix, 'bin', 'serverless')
+        with file_lock(prefix + '.lock'):
+            if not os.path.exists(shared_executable):
+                command = 'npm install --prefix {} -g'.format(
+                    prefix).split() + options + [package]
+                self.execute(command, cwd=self.root_directory)
+            else:
+                self.logger.debug(
+                    'Reusing serverless from {}.'.format(prefix))
+        os.makedirs(os.path.dirname(executable_path), exist_ok=True)
+        temp_link = '{}.tmp-{}'.format(executable_path, uuid.uuid4().hex)
+        os.symlink(shared_executable, temp_link)
+        os.replace(temp_link, executable_path)
+        self.executable_path = executable_path
+
+    def uninstall_with_npm(self):
+        command = 'npm uninstall --prefix {} -g serverless'.format(
+            self.root_directory)
+        self.execute(
+            command.split(),
+            cwd=self.root_directory)
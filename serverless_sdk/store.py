@@ -0,0 +1,77 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import uuid
+import fcntl
+import shutil
+import tempfile
+
+from .utils import sha256_file
+
+
+class ContentStore(object):
+    """A directory of files that are named by the sha256 of their content.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def contains(self, digest):
+        return bool(digest) and os.path.isfile(self.path(digest))
+
+    def temp_path(self):
+        os.makedirs(self.directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(
+            dir=self.directory, prefix='.tmp-')
+        os.close(handle)
+        return temp_path
+
+    def add(self, source):
+        """Move source into the store and return its digest."""
+        digest = sha256_file(source)
+        os.makedirs(self.directory, exist_ok=True)
+        os.replace(source, self.path(digest))
+        return digest
+
+    def link(self, digest, target):
+        """Place a stored file at target, hardlinking when possible."""
+        source = self.path(digest)
+        temp_target = '{}.tmp-{}'.format(target, uuid.uuid4().hex)
+        try:
+            os.link(source, temp_target)
+        except OSError:
+            if not _reflink(source, temp_target):
+                shutil.copy2(source, temp_target)
+        os.replace(temp_target, target)
+        return target
+
+
+# From linux/fs.h, clones the extents of a file on btrfs, xfs and others.
+FICLONE = 0x40049409
+
+
+def _reflink(source, target):
+    try:
+        with open(source, 'rb') as infile, open(target, 'wb') as outfile:
+            fcntl.ioctl(outfile.fileno(), FICLONE, infile.fileno())
+        shutil.copystat(source, target)
+    except (IOError, OSError):
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+    return True
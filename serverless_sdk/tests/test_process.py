@@ -0,0 +1,117 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import shutil
+import unittest
+from tempfile import mkdtemp
+
+from mock import Mock
+
+from .. import Serverless
+from ..process import StreamingProcess, CloudifyServerlessProcessError
+
+
+def _process_state(pid):
+    # A killed orphan may linger as a zombie until init reaps it.
+    try:
+        with open('/proc/{}/stat'.format(pid)) as infile:
+            return infile.read().rsplit(')', 1)[1].split()[0]
+    except IOError:
+        return None
+
+
+class StreamingProcessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = Mock()
+        self.parent_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.parent_dir)
+        self.root_dir = os.path.join(self.parent_dir, 'test_ni')
+        os.mkdir(self.root_dir)
+
+    def test_streams_and_bounds_output(self):
+        spill_path = os.path.join(self.root_dir, 'logs', 'out.log')
+        process = StreamingProcess(
+            ['sh', '-c', 'for i in $(seq 1 100); do echo line $i; done; '
+                         'echo oops >&2'],
+            self.logger,
+            buffer_lines=10,
+            spill_path=spill_path)
+        output = process.run()
+        self.assertEqual(
+            output.splitlines(),
+            ['line {}'.format(i) for i in range(91, 101)])
+        self.assertEqual(process.stderr, 'oops')
+        self.assertEqual(output.stderr, 'oops')
+        self.assertNotIn('oops', output)
+        self.assertEqual(self.logger.info.call_count, 100)
+        self.logger.error.assert_called_with('<err>: oops')
+        with open(spill_path) as spill_file:
+            self.assertEqual(len(spill_file.read().splitlines()), 101)
+        self.assertEqual(process.output_bytes, 792 + 5)
+
+    def test_stderr_only(self):
+        output = StreamingProcess(
+            ['sh', '-c', 'echo progress >&2'], self.logger).run()
+        self.assertEqual(output, '')
+        self.assertEqual(output.stderr, 'progress')
+
+    def test_failure(self):
+        process = StreamingProcess(
+            ['sh', '-c', 'echo Rate exceeded >&2; exit 3'], self.logger)
+        with self.assertRaises(CloudifyServerlessProcessError) as error:
+            process.run()
+        self.assertEqual(error.exception.exit_code, 3)
+        self.assertFalse(error.exception.timed_out)
+        self.assertIn('Rate exceeded', str(error.exception))
+
+    def test_timeout_kills_process_tree(self):
+        pid_file = os.path.join(self.root_dir, 'child.pid')
+        process = StreamingProcess(
+            ['sh', '-c', 'sleep 30 & echo $! > {}; wait'.format(pid_file)],
+            self.logger,
+            timeout=1)
+        start = time.time()
+        with self.assertRaises(CloudifyServerlessProcessError) as error:
+            process.run()
+        self.assertTrue(error.exception.timed_out)
+        self.assertLess(time.time() - start, 10)
+        with open(pid_file) as infile:
+            child_pid = int(infile.read())
+        time.sleep(0.1)
+        self.assertNotIn(_process_state(child_pid), ('R', 'S', 'D'))
+
+    def test_serverless_execute(self):
+        sl = Serverless(
+            self.logger,
+            'test_dp',
+            'test_ni',
+            resource_config={'env': {'FOO': 'bar'}},
+            serverless_config={
+                'executable_path': 'sh',
+                'command_timeouts': {'default': 5},
+                'spill_output': True,
+                'binary_lock_directory': os.path.join(
+                    self.parent_dir, 'locks'),
+            },
+            root_directory=self.root_dir,
+        )
+        output = sl.execute(['sh', '-c', 'echo $FOO; pwd'])
+        self.assertEqual(output.splitlines(), ['bar', self.root_dir])
+        self.assertEqual(sl.command_timeout(['sh', '-c']), 5)
+        self.assertEqual(len(os.listdir(os.path.join(
+            self.parent_dir, '.logs', 'test_ni'))), 1)
+        self.assertEqual(os.listdir(self.root_dir), [])
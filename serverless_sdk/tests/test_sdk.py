@@ -13,16 +13,25 @@
 # limitations under the License.
 
 import os
+import sys
+import json
+import time
 import yaml
 import shutil
 import logging
 import unittest
+import threading
+import subprocess
+from datetime import datetime
 from functools import wraps
 from tempfile import mkdtemp
 
 from mock import patch
 
-from .. import Serverless
+from .. import Serverless, CloudifyServerlessSDKError, parsers, yaml_utils
+from ..locks import file_lock
+from ..process import ProcessOutput
+from ..utils import run_concurrently
 
 TEST_SERVERLESS_CONFIG = {
     'executable_path': 'foo',
@@ -75,6 +84,32 @@ functions:
   hello_2: aws-service-dev-hello_2
 """
 
+DEPLOY_OUTPUT_V2 = """Serverless: Packaging service...
+Serverless: Stack update finished...
+Service Information
+service: aws-service
+stage: dev
+region: us-east-1
+stack: aws-service-dev
+resources: 6
+functions:
+  hello_1: aws-service-dev-hello_1
+  hello_2: aws-service-dev-hello_2
+Serverless: Removing old service artifacts from S3...
+"""
+
+DEPLOY_OUTPUT_V3 = """
+Deploying aws-service to stage dev (us-east-1)
+
+\x1b[32m\u2714\x1b[39m Service deployed to stack aws-service-dev (112s)
+
+functions:
+  hello_1: aws-service-dev-hello_1 (1.5 kB)
+  hello_2: aws-service-dev-hello_2 (1.5 kB)
+
+Need a better logging experience? Try our Dev Mode in Console.
+"""
+
 FOO_JSON = {
     'service': 'aws-service',
     'stage': 'dev',
@@ -87,8 +122,32 @@ FOO_JSON = {
 }
 
 
+METRICS_OUTPUT = """Service wide
+January 1, 2:26 PM - January 2, 2:26 PM
+
+Invocations: 1,200
+Throttles: 0
+Errors: 3
+Duration (avg.): 34.3ms
+Duration (p95): 1.2s
+
+qux
+December 31, 2:26 PM - January 1, 2:26 PM
+
+Invocations: 7
+"""
+
+
 class ServerlessSDKTestBase(unittest.TestCase):
 
+    def setUp(self):
+        lock_directory = mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_directory)
+        patcher = patch('serverless_sdk.serverless.BINARY_LOCK_DIRECTORY',
+                        lock_directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @property
     def test_options(self):
         return [
@@ -357,10 +416,18 @@ class ServerlessSDKTestBase(unittest.TestCase):
 
         with patch('serverless_sdk.Serverless._execute') as run_subprocess:
             run_subprocess.return_value = True
-            sl.configure()
+            self.assertTrue(sl.configure())
             with open(os.path.join(test_root_dir, 'serverless.yml'),
                       'r') as fout:
                 self.assertEqual(fout.read(), EXPECTED_SERVERLESS_YML)
+            stat = os.stat(sl.serverless_config_path)
+            self.assertFalse(sl.configure())
+            self.assertEqual(
+                os.stat(sl.serverless_config_path).st_mtime_ns,
+                stat.st_mtime_ns)
+            self.assertEqual(
+                os.stat(sl.serverless_config_path).st_ino, stat.st_ino)
+            self.assertEqual(os.listdir(test_root_dir), ['serverless.yml'])
 
     @_test_wrapper
     def test_invoke(self,
@@ -470,3 +537,573 @@ class ServerlessSDKTestBase(unittest.TestCase):
                 return_output=sl._log_stdout
             )
             self.assertEqual(result, FOO_JSON)
+
+    @_test_wrapper
+    def test_fingerprint(self,
+                         test_logger,
+                         test_root_dir,
+                         *_,
+                         **__):
+        resource_config = {
+            'name': 'bar',
+            'functions': [
+                {'name': 'qux', 'handler': 'quux', 'path': 'handler.py'},
+            ]
+        }
+        sl = Serverless(
+            test_logger,
+            'test_dp',
+            'test_ni',
+            TEST_CLIENT_CONFIG,
+            resource_config,
+            TEST_SERVERLESS_CONFIG,
+            test_root_dir,
+        )
+        handler_path = os.path.join(test_root_dir, 'handler.py')
+        with open(handler_path, 'w') as outfile:
+            outfile.write('def quux(): pass')
+        fingerprint = sl.fingerprint()
+        self.assertEqual(fingerprint, sl.fingerprint())
+        with open(handler_path, 'w') as outfile:
+            outfile.write('def quux(): return 1')
+        self.assertNotEqual(fingerprint, sl.fingerprint())
+        fingerprint = sl.fingerprint()
+        with open(sl.serverless_config_path, 'w') as outfile:
+            outfile.write('service: bar')
+        self.assertNotEqual(fingerprint, sl.fingerprint())
+        fingerprint = sl.fingerprint()
+        resource_config['env'] = {'foo': 'bar'}
+        self.assertNotEqual(fingerprint, sl.fingerprint())
+
+    @_test_wrapper
+    def test_deploy_from_artifact_cache(self,
+                                        test_logger,
+                                        test_root_dir,
+                                        *_,
+                                        **__):
+        cache_dir = os.path.join(test_root_dir, 'artifacts')
+        serverless_config = dict(
+            TEST_SERVERLESS_CONFIG, artifact_cache_directory=cache_dir)
+        commands = []
+
+        def fake_execute(command, cwd, *_, **__):
+            commands.append((command, cwd))
+            if command[1] == 'package':
+                os.makedirs(command[-1])
+                with open(os.path.join(command[-1], 'bar.zip'), 'w'):
+                    pass
+
+        with patch('serverless_sdk.Serverless._execute') as run_subprocess:
+            run_subprocess.side_effect = fake_execute
+            for instance in ['test_ni_1', 'test_ni_2']:
+                instance_dir = os.path.join(test_root_dir, instance)
+                os.makedirs(instance_dir)
+                with open(os.path.join(instance_dir, 'serverless.yml'),
+                          'w') as outfile:
+                    outfile.write('service: bar')
+                sl = Serverless(
+                    test_logger,
+                    'test_dp',
+                    instance,
+                    TEST_CLIENT_CONFIG,
+                    {'name': 'bar'},
+                    serverless_config,
+                    instance_dir,
+                )
+                sl.deploy()
+        artifact = os.path.join(cache_dir, sl.fingerprint())
+        self.assertEqual(
+            [(command[1:], os.path.basename(cwd))
+             for command, cwd in commands],
+            [(['package', '--package', commands[0][0][-1]], 'test_ni_1'),
+             (['deploy', '--package', artifact], 'test_ni_1'),
+             (['deploy', '--package', artifact], 'test_ni_2')])
+        self.assertEqual(os.listdir(artifact), ['bar.zip'])
+        self.assertEqual(
+            sorted(os.listdir(cache_dir)),
+            [os.path.basename(artifact), os.path.basename(artifact) + '.lock'])
+
+    @_test_wrapper
+    def test_deploy_targets_keeps_packages(self,
+                                           test_logger,
+                                           test_root_dir,
+                                           *_,
+                                           **__):
+        cache_dir = os.path.join(test_root_dir, 'artifacts')
+        instance_dir = os.path.join(test_root_dir, 'test_ni')
+        os.makedirs(instance_dir)
+        sl = Serverless(
+            test_logger,
+            'test_dp',
+            'test_ni',
+            TEST_CLIENT_CONFIG,
+            {'name': 'bar'},
+            dict(TEST_SERVERLESS_CONFIG,
+                 artifact_cache_directory=cache_dir,
+                 artifact_cache_max_size=1),
+            instance_dir,
+        )
+        deployed = []
+
+        def fake_execute(command, *_, **__):
+            package = command[command.index('--package') + 1]
+            if command[1] == 'package':
+                os.makedirs(package)
+                with open(os.path.join(package, 'bar.zip'), 'wb') as f:
+                    f.write(b'0' * 700 * 1024)
+            else:
+                deployed.append(os.path.isdir(package))
+
+        targets = [{'stage': 'dev'}, {'stage': 'prod'}]
+        with patch('serverless_sdk.Serverless._execute') as run_subprocess:
+            run_subprocess.side_effect = fake_execute
+            outcomes = sl.deploy_targets(targets, 'fingerprint')
+        self.assertEqual([error for _, _, error in outcomes], [None, None])
+        self.assertEqual(deployed, [True, True])
+        # Once deployed, the packages may be evicted by the next prune.
+        sl.prune_artifact_cache()
+        self.assertEqual(
+            len([name for name in os.listdir(cache_dir)
+                 if not name.endswith('.lock')]), 1)
+
+    @_test_wrapper
+    def test_prune_artifact_cache(self, test_logger, test_root_dir, *_, **__):
+        cache_dir = os.path.join(test_root_dir, 'artifacts')
+        sl = Serverless(
+            test_logger,
+            'test_dp',
+            'test_ni',
+            TEST_CLIENT_CONFIG,
+            {'name': 'bar'},
+            dict(TEST_SERVERLESS_CONFIG,
+                 artifact_cache_directory=cache_dir,
+                 artifact_cache_max_size=1),
+            test_root_dir,
+        )
+        for age, name in enumerate(['new', 'old', '.tmp-1', 'older']):
+            os.makedirs(os.path.join(cache_dir, name))
+            with open(os.path.join(cache_dir, name, 'bar.zip'), 'wb') as f:
+                f.write(b'0' * 300 * 1024)
+            with open(os.path.join(cache_dir, name + '.lock'), 'w'):
+                pass
+            used = time.time() - age * 100
+            for path in [os.path.join(cache_dir, name, 'bar.zip'),
+                         os.path.join(cache_dir, name)]:
+                os.utime(path, (used, used))
+        # A package that is deployed from holds its lock, and is kept.
+        with file_lock(os.path.join(cache_dir, 'old.lock'), shared=True):
+            sl.prune_artifact_cache([os.path.join(cache_dir, 'older')])
+        self.assertEqual(
+            sorted(os.listdir(cache_dir)),
+            ['.tmp-1', '.tmp-1.lock', 'new.lock', 'old', 'old.lock',
+             'older', 'older.lock'])
+
+    @_test_wrapper
+    def test_deploy_changed_functions(self,
+                                      test_logger,
+                                      test_root_dir,
+                                      *_,
+                                      **__):
+        resource_config = {
+            'name': 'bar',
+            'functions': [
+                {'name': 'qux', 'handler': 'a.quux', 'path': 'a.py',
+                 'events': ['bongo']},
+                {'name': 'quuz', 'handler': 'b.quuz', 'path': 'b.py'},
+            ]
+        }
+        sl = Serverless(
+            test_logger,
+            'test_dp',
+            'test_ni',
+            TEST_CLIENT_CONFIG,
+            resource_config,
+            TEST_SERVERLESS_CONFIG,
+            test_root_dir,
+        )
+        for filename in ['a.py', 'b.py']:
+            with open(os.path.join(test_root_dir, filename), 'w') as outfile:
+                outfile.write('pass')
+        sl.configure()
+        previous_state = sl.deploy_state()
+        with open(os.path.join(test_root_dir, 'a.py'), 'w') as outfile:
+            outfile.write('def quux(): pass')
+        with patch('serverless_sdk.Serverless._execute') as run_subprocess:
+            run_subprocess.return_value = 'done'
+            result = sl.deploy(previous_state)
+            run_subprocess.assert_called_once()
+            self.assertEqual(
+                run_subprocess.call_args[0][0],
+                ['foo', 'deploy', 'function', '--function', 'qux'])
+            self.assertEqual(result, {'qux': 'done'})
+
+        # Changes of config, like events or the role, need a full deploy,
+        # as deploy function does not update the resources of the stack.
+        for key, value in [('events', ['bingo']), ('role', 'qux_role')]:
+            previous_state = sl.deploy_state()
+            resource_config['functions'][0][key] = value
+            sl.configure()
+            with patch('serverless_sdk.Serverless._execute') as \
+                    run_subprocess:
+                sl.deploy(previous_state)
+                self.assertEqual(
+                    run_subprocess.call_args[0][0], ['foo', 'deploy'])
+
+        previous_state = sl.deploy_state()
+        self.assertNotIn(
+            'super_secret', json.dumps(previous_state, sort_keys=True))
+        sl.client_config = dict(
+            TEST_CLIENT_CONFIG,
+            credentials=dict(TEST_CLIENT_CONFIG['credentials'],
+                             secret='rotated_secret'))
+        self.assertIsNone(
+            sl.changed_functions(previous_state, sl.deploy_state()))
+
+    @_test_wrapper
+    def test_install_with_npm_shared_prefix(self,
+                                            test_logger,
+                                            test_root_dir,
+                                            *_,
+                                            **__):
+        shared_prefix = os.path.join(test_root_dir, 'shared')
+        tarballs = []
+        for directory in ['a', 'b']:
+            tarballs.append(os.path.join(
+                test_root_dir, directory, 'serverless-3.22.0.tgz'))
+            os.makedirs(os.path.dirname(tarballs[-1]))
+            with open(tarballs[-1], 'w') as outfile:
+                outfile.write(directory)
+
+        def fake_npm(command, *_, **__):
+            prefix = command[3]
+            os.makedirs(os.path.join(prefix, 'bin'))
+            with open(os.path.join(prefix, 'bin', 'serverless'), 'w'):
+                pass
+
+        with patch('serverless_sdk.Serverless._execute') as run_subprocess:
+            run_subprocess.side_effect = fake_npm
+            for instance, tarball in [('test_ni_1', tarballs[0]),
+                                      ('test_ni_2', tarballs[0]),
+                                      ('test_ni_3', tarballs[1])]:
+                instance_dir = os.path.join(test_root_dir, instance)
+                sl = Serverless(
+                    test_logger,
+                    'test_dp',
+                    instance,
+                    root_directory=instance_dir,
+                )
+                sl.install_with_npm(
+                    package=tarball,
+                    shared_prefix=shared_prefix,
+                    cache='/npm-cache',
+                    offline=True)
+                prefix = run_subprocess.call_args[0][0][3]
+                self.assertEqual(
+                    os.path.realpath(sl.executable_path),
+                    os.path.join(prefix, 'bin', 'serverless'))
+            self.assertEqual(run_subprocess.call_count, 2)
+            first, second = [c[0][0] for c in run_subprocess.call_args_list]
+            self.assertEqual(
+                first,
+                ['npm', 'install', '--prefix', first[3], '-g',
+                 '--cache', '/npm-cache', '--offline', tarballs[0]])
+            self.assertEqual(os.path.dirname(first[3]), shared_prefix)
+            self.assertTrue(os.path.basename(first[3]).startswith(
+                'serverless-3.22.0.tgz-'))
+            self.assertNotEqual(first[3], second[3])
+
+    @_test_wrapper
+    def test_scratch_directory(self, test_logger, test_root_dir, *_, **__):
+        instance_dir = os.path.join(test_root_dir, 'test_ni')
+        sl = Serverless(
+            test_logger,
+            'test_dp',
+            'test_ni',
+            serverless_config={'executable_path': 'foo',
+                               'scratch_max_size': 1},
+            root_directory=instance_dir,
+        )
+        scratch = os.path.join(test_root_dir, '.scratch', 'test_ni')
+
+        def fill_scratch(command, cwd, env, **_):
+            name = command[-1]
+            with open(os.path.join(env['TMPDIR'], name), 'wb') as outfile:
+                outfile.write(b'0' * 400 * 1024)
+            os.utime(os.path.join(env['TMPDIR'], name),
+                     (len(os.listdir(env['TMPDIR'])),) * 2)
+
+        with patch('serverless_sdk.Serverless._execute') as run_subprocess:
+            run_subprocess.side_effect = fill_scratch
+            for name in ['a', 'b', 'c', 'd']:
+                sl.execute(['foo', name])
+        self.assertEqual(sl.tempenv, scratch)
+        self.assertEqual(sorted(os.listdir(scratch)), ['a', 'b', 'c', 'd'])
+        sl.prune_scratch()
+        self.assertEqual(sorted(os.listdir(scratch)), ['c', 'd'])
+        sl.clean()
+        self.assertFalse(os.path.exists(scratch))
+
+    @_test_wrapper
+    def test_binary_lock(self, test_logger, test_root_dir, *_, **__):
+        sl = Serverless(test_logger, 'test_dp', 'test_ni',
+                        root_directory=test_root_dir)
+        binary = os.path.join(test_root_dir, 'serverless')
+        with open(binary, 'w'):
+            pass
+        os.link(binary, os.path.join(test_root_dir, 'hardlink'))
+        os.symlink(binary, os.path.join(test_root_dir, 'symlink'))
+        with open(os.path.join(test_root_dir, 'other'), 'w'):
+            pass
+        with patch('serverless_sdk.serverless.file_lock') as lock:
+            for name in ['serverless', 'hardlink', 'symlink', 'other',
+                         'missing']:
+                with sl.binary_lock(os.path.join(test_root_dir, name)):
+                    pass
+        lock_paths = [c[0][0] for c in lock.call_args_list]
+        self.assertEqual(len(set(lock_paths[:3])), 1)
+        self.assertEqual(len(set(lock_paths)), 3)
+
+    @_test_wrapper
+    def test_binary_lock_removed(self, test_logger, test_root_dir, *_, **__):
+        lock_directory = os.path.join(test_root_dir, 'locks')
+        sl = Serverless(test_logger, 'test_dp', 'test_ni',
+                        serverless_config={
+                            'binary_lock_directory': lock_directory},
+                        root_directory=test_root_dir)
+        binary = os.path.join(test_root_dir, 'serverless')
+        with sl.binary_lock(binary):
+            with open(binary + '.tmp', 'w'):
+                pass
+            os.rename(binary + '.tmp', binary)
+        with sl.binary_lock(binary, shared=True):
+            pass
+        self.assertEqual(len(os.listdir(lock_directory)), 1)
+        with sl.binary_lock(binary):
+            with open(binary + '.tmp', 'w'):
+                pass
+            os.rename(binary + '.tmp', binary)
+        self.assertEqual(os.listdir(lock_directory), [])
+
+    @_test_wrapper
+    def test_process_slots(self, test_logger, test_root_dir, *_, **__):
+        sl = Serverless(
+            test_logger,
+            'test_dp',
+            'test_ni',
+            serverless_config={
+                'executable_path': 'foo',
+                'max_processes': 2,
+                'process_lock_directory': os.path.join(
+                    test_root_dir, 'processes'),
+            },
+            root_directory=test_root_dir,
+        )
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def fake_execute(command, *_, **__):
+            with lock:
+                running.append(command)
+                max_running.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(command)
+
+        with patch('serverless_sdk.Serverless._execute') as run_subprocess:
+            run_subprocess.side_effect = fake_execute
+            sl.deploy_functions(
+                ['func{}'.format(i) for i in range(6)], max_concurrency=6)
+        self.assertEqual(run_subprocess.call_count, 6)
+        self.assertEqual(max(max_running), 2)
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(test_root_dir, 'processes'))),
+            ['slot-0.lock', 'slot-1.lock'])
+
+    @_test_wrapper
+    def test_service_lock(self, test_logger, test_root_dir, *_, **__):
+        instance_dir = os.path.join(test_root_dir, 'test_ni')
+        sl = Serverless(
+            test_logger,
+            'test_dp',
+            'test_ni',
+            resource_config=TEST_RESOURCE_CONFIG,
+            serverless_config=TEST_SERVERLESS_CONFIG,
+            root_directory=instance_dir,
+        )
+        lock_path = os.path.join(test_root_dir, '.locks', 'test_ni.lock')
+        holder = subprocess.Popen(
+            [sys.executable, '-c',
+             'import os, sys, time, fcntl\n'
+             'os.makedirs(os.path.dirname(sys.argv[1]), exist_ok=True)\n'
+             'lock = open(sys.argv[1], "a")\n'
+             'fcntl.flock(lock, fcntl.LOCK_EX)\n'
+             'print("locked", flush=True)\n'
+             'time.sleep(0.5)\n',
+             lock_path],
+            stdout=subprocess.PIPE)
+        self.addCleanup(holder.wait)
+        self.assertEqual(holder.stdout.readline().strip(), b'locked')
+        holder.stdout.close()
+        with patch('serverless_sdk.Serverless._execute') as run_subprocess:
+            run_subprocess.return_value = 'service: bar'
+            started = time.time()
+            self.assertEqual(sl.info(), {'service': 'bar'})
+            self.assertGreater(time.time() - started, 0.3)
+            # The lock is reentrant, and shared locks are not upgraded.
+            with sl.service_lock():
+                sl.destroy()
+                sl.info()
+            with sl.service_lock(shared=True):
+                self.assertRaises(CloudifyServerlessSDKError, sl.destroy)
+
+    @_test_wrapper
+    def test_file_lock_threads(self, test_logger, test_root_dir, *_, **__):
+        lock_path = os.path.join(test_root_dir, 'test.lock')
+        holders = []
+        max_holders = []
+        guard = threading.Lock()
+
+        def hold(_):
+            with file_lock(lock_path):
+                with guard:
+                    holders.append(1)
+                    max_holders.append(len(holders))
+                time.sleep(0.05)
+                with guard:
+                    holders.pop()
+
+        threads = [threading.Thread(target=hold, args=(i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(max_holders), 1)
+
+        # A writer thread waits for the shared lock of another thread.
+        events = []
+        shared_taken = threading.Event()
+
+        def reader():
+            with file_lock(lock_path, shared=True):
+                shared_taken.set()
+                time.sleep(0.2)
+                events.append('reader done')
+
+        def writer():
+            shared_taken.wait()
+            with file_lock(lock_path):
+                events.append('writer')
+
+        threads = [threading.Thread(target=reader),
+                   threading.Thread(target=writer)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(events, ['reader done', 'writer'])
+
+        # Workers reenter the locks of their caller.
+        with file_lock(lock_path):
+            outcomes = run_concurrently(
+                hold, range(2), max_concurrency=2)
+        self.assertEqual([error for _, _, error in outcomes], [None, None])
+
+    def test_yaml_libyaml_fallback(self):
+        config = yaml.safe_load(EXPECTED_SERVERLESS_YML)
+        config['description'] = 'caf\u00e9 ' * 40
+        for use_libyaml in (True, False):
+            dumped = yaml_utils.safe_dump(
+                config, default_flow_style=False, use_libyaml=use_libyaml)
+            self.assertEqual(
+                dumped,
+                yaml.safe_dump(config, default_flow_style=False))
+            self.assertEqual(
+                yaml_utils.safe_load(dumped, use_libyaml=use_libyaml),
+                config)
+        for use_libyaml in [True, False]:
+            self.assertEqual(
+                yaml_utils.safe_load(
+                    ProcessOutput('service: bar', 'Deploying'),
+                    use_libyaml=use_libyaml),
+                {'service': 'bar'})
+        with patch('yaml.CSafeLoader', new=None, create=True), \
+                patch('yaml.CSafeDumper', new=None, create=True):
+            del yaml.CSafeLoader, yaml.CSafeDumper
+            self.assertIs(yaml_utils.loader(), yaml.SafeLoader)
+            self.assertIs(yaml_utils.dumper(), yaml.SafeDumper)
+
+    def test_parse_service_information(self):
+        self.assertEqual(
+            parsers.parse_service_information(DEPLOY_OUTPUT_V3), FOO_JSON)
+        expected = dict(FOO_JSON, resources=6)
+        self.assertEqual(
+            parsers.parse_service_information(DEPLOY_OUTPUT_V2), expected)
+        self.assertIsNone(
+            parsers.parse_service_information('Serverless: Error'))
+        stdout = '\n'.join(
+            line for line in DEPLOY_OUTPUT_V3.splitlines()
+            if line.startswith(('functions:', '  hello')))
+        stderr = '\n'.join(
+            line for line in DEPLOY_OUTPUT_V3.splitlines()
+            if not line.startswith(('functions:', '  hello')))
+        self.assertIsNone(parsers.parse_service_information(stdout))
+        self.assertEqual(
+            parsers.parse_service_information(stdout, stderr), FOO_JSON)
+        self.assertEqual(
+            parsers.parse_service_information(
+                ProcessOutput(stdout, stderr)),
+            FOO_JSON)
+        self.assertEqual(
+            parsers.parse_service_information(
+                ProcessOutput('', stderr + '\n')),
+            dict((k, v) for k, v in FOO_JSON.items() if k != 'functions'))
+        self.assertIsNone(parsers.parse_service_information({'qux': 'done'}))
+
+    def test_parse_metrics(self):
+        now = datetime(2026, 1, 5)
+        records = parsers.parse_metrics(METRICS_OUTPUT, now=now)
+
+        def epoch(*args):
+            return int(time.mktime(datetime(*args).timetuple()))
+
+        self.assertEqual(records, [
+            {
+                'function': None,
+                'start': epoch(2026, 1, 1, 14, 26),
+                'end': epoch(2026, 1, 2, 14, 26),
+                'invocations': 1200,
+                'throttles': 0,
+                'errors': 3,
+                'duration_avg': 34.3,
+                'duration_p95': 1200.0,
+            },
+            {
+                'function': 'qux',
+                'start': epoch(2025, 12, 31, 14, 26),
+                'end': epoch(2026, 1, 1, 14, 26),
+                'invocations': 7,
+            },
+        ])
+        self.assertEqual(parsers.parse_metrics('Serverless: Error'), [])
+        records.append(dict(records[1], start=epoch(2026, 1, 1, 14, 26),
+                            errors=1))
+        self.assertEqual(parsers.metrics_series(records, 'bar'), {
+            'bar': {
+                'start': [epoch(2026, 1, 1, 14, 26)],
+                'end': [epoch(2026, 1, 2, 14, 26)],
+                'invocations': [1200],
+                'throttles': [0],
+                'errors': [3],
+                'duration_avg': [34.3],
+                'duration_p95': [1200.0],
+            },
+            'qux': {
+                'start': [epoch(2025, 12, 31, 14, 26),
+                          epoch(2026, 1, 1, 14, 26)],
+                'end': [epoch(2026, 1, 1, 14, 26)] * 2,
+                'invocations': [7, 7],
+                'errors': [None, 1],
+            },
+        })
@@ -0,0 +1,160 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import shutil
+import unittest
+from tempfile import mkdtemp
+
+from mock import Mock
+
+from .. import (
+    Serverless, CloudifyServerlessSDKError, CloudifyServerlessBatchError)
+from ..process import CloudifyServerlessProcessError
+from ..throttle import AdaptiveLimiter, is_throttling_error
+
+# A serverless executable that throttles the calls whose sequence numbers
+# are in FAKE_THROTTLE_SCHEDULE, and records the calls it got.
+FAKE_SERVERLESS = """#!{python}
+import os
+import sys
+import json
+import time
+import fcntl
+
+state_path = os.environ['FAKE_STATE']
+schedule = [int(n) for n in os.environ['FAKE_THROTTLE_SCHEDULE'].split(',')]
+with open(state_path + '.lock', 'a') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    state = {{'calls': [], 'running': 0, 'max_running': 0}}
+    if os.path.exists(state_path):
+        with open(state_path) as infile:
+            state = json.load(infile)
+    state['calls'].append(sys.argv[-1])
+    state['running'] += 1
+    state['max_running'] = max(state['max_running'], state['running'])
+    sequence = len(state['calls'])
+    with open(state_path, 'w') as outfile:
+        json.dump(state, outfile)
+time.sleep(0.05)
+with open(state_path + '.lock', 'a') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    with open(state_path) as infile:
+        state = json.load(infile)
+    state['running'] -= 1
+    with open(state_path, 'w') as outfile:
+        json.dump(state, outfile)
+if sys.argv[-1] == 'missing':
+    sys.stderr.write('Function "missing" does not exist\\n')
+    sys.exit(1)
+if sequence in schedule:
+    sys.stderr.write(
+        'TooManyRequestsException: Rate exceeded for {{}}\\n'.format(
+            sys.argv[-1]))
+    sys.exit(1)
+print('deployed ' + sys.argv[-1])
+"""
+
+
+class ThrottleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root_dir)
+        self.executable_path = os.path.join(self.root_dir, 'serverless')
+        with open(self.executable_path, 'w') as outfile:
+            outfile.write(FAKE_SERVERLESS.format(python=sys.executable))
+        os.chmod(self.executable_path, 0o755)
+        self.state_path = os.path.join(self.root_dir, 'state.json')
+
+    def _serverless(self, schedule):
+        return Serverless(
+            Mock(),
+            'test_dp',
+            'test_ni',
+            resource_config={
+                'env': {
+                    'FAKE_STATE': self.state_path,
+                    'FAKE_THROTTLE_SCHEDULE': schedule,
+                },
+            },
+            serverless_config={
+                'executable_path': self.executable_path,
+                'binary_lock_directory': os.path.join(self.root_dir, 'locks'),
+                'throttling': {'backoff_base': 0.01, 'backoff_cap': 0.05},
+            },
+            root_directory=self.root_dir,
+        )
+
+    def _state(self):
+        with open(self.state_path) as infile:
+            return json.load(infile)
+
+    def test_deploy_functions_throttled(self):
+        sl = self._serverless('1,2,3,7')
+        names = ['func{}'.format(i) for i in range(8)]
+        results = sl.deploy_functions(names, max_concurrency=4)
+        self.assertEqual(
+            results, {name: 'deployed ' + name for name in names})
+        state = self._state()
+        self.assertEqual(len(state['calls']), len(names) + 4)
+        self.assertEqual(sorted(set(state['calls'])), names)
+        self.assertLessEqual(state['max_running'], 4)
+
+    def test_other_errors_are_not_retried(self):
+        sl = self._serverless('0')
+        with self.assertRaises(CloudifyServerlessSDKError) as error:
+            sl.deploy_functions(['func', 'missing'], max_concurrency=2)
+        self.assertIn('does not exist', str(error.exception))
+        self.assertEqual(sorted(self._state()['calls']), ['func', 'missing'])
+
+    def test_retries_exhausted(self):
+        sl = self._serverless(','.join(str(n) for n in range(1, 10)))
+        sl.serverless_config['throttling']['retries'] = 2
+        outcomes = sl.run_concurrently(sl.deploy_function, ['func'])
+        self.assertTrue(is_throttling_error(outcomes[0][2]))
+        self.assertEqual(len(self._state()['calls']), 3)
+        with self.assertRaises(CloudifyServerlessBatchError) as error:
+            sl.deploy_functions(['func', 'other'])
+        self.assertEqual(
+            [name for name, _, e in error.exception.outcomes
+             if is_throttling_error(e)], ['func', 'other'])
+
+    def test_limiter(self):
+        limiter = AdaptiveLimiter(8)
+        generation = limiter.acquire()
+        limiter.on_throttle(generation)
+        limiter.on_throttle(generation)
+        limiter.release()
+        self.assertEqual(limiter.slots, 4)
+        for _ in range(4):
+            limiter.on_success()
+        self.assertEqual(limiter.slots, 5)
+        for _ in range(100):
+            limiter.on_success()
+        self.assertEqual(limiter.slots, 8)
+        for _ in range(10):
+            limiter.on_throttle(limiter.acquire())
+            limiter.release()
+        self.assertEqual(limiter.slots, 1)
+
+    def test_is_throttling_error(self):
+        self.assertTrue(is_throttling_error(CloudifyServerlessProcessError(
+            ['sls', 'invoke'], 1, '', 'ThrottlingException: Rate exceeded')))
+        self.assertFalse(is_throttling_error(CloudifyServerlessProcessError(
+            ['sls', 'invoke'], 1, '', 'AccessDenied')))
+        self.assertFalse(is_throttling_error(CloudifyServerlessProcessError(
+            ['sls', 'invoke'], None, 'Rate exceeded', '', timed_out=True)))
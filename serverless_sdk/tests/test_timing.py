@@ -0,0 +1,111 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from mock import Mock
+from cloudify.state import current_ctx
+
+from .. import yaml_utils
+from ..utils import run_concurrently
+from ..timing import (
+    MAX_RECORDED_COMMANDS,
+    operation_timer,
+    record_command,
+    timed)
+
+
+class TimingTest(unittest.TestCase):
+
+    def tearDown(self):
+        current_ctx.clear()
+
+    def test_no_operation(self):
+        with timed('phase'):
+            record_command(['serverless', 'info'], 0, 0.1, 10)
+
+    def test_operation_timer(self):
+        ctx = Mock()
+        current_ctx.set(ctx=ctx)
+        with operation_timer(ctx, 'start') as timer:
+            with timed('properties'):
+                pass
+            yaml_utils.safe_load(yaml_utils.safe_dump({'a': 1}))
+
+            def command(index):
+                with timed('deploy'):
+                    record_command(
+                        ['/usr/bin/serverless', 'invoke', str(index)],
+                        0,
+                        index / 1000.0,
+                        index)
+            run_concurrently(command, range(MAX_RECORDED_COMMANDS + 5))
+        with timed('after'):
+            pass
+        record = timer.record()
+        json.dumps(record)
+        self.assertEqual(record['operation'], 'start')
+        self.assertEqual(record['phases']['properties'][0], 1)
+        self.assertEqual(record['phases']['yaml_load'][0], 1)
+        self.assertEqual(record['phases']['yaml_dump'][0], 1)
+        self.assertEqual(
+            record['phases']['deploy'][0], MAX_RECORDED_COMMANDS + 5)
+        self.assertNotIn('after', record['phases'])
+        self.assertEqual(
+            record['commands']['count'], MAX_RECORDED_COMMANDS + 5)
+        slowest = record['commands']['slowest']
+        self.assertEqual(len(slowest), MAX_RECORDED_COMMANDS)
+        self.assertEqual(
+            slowest[0],
+            [['serverless', 'invoke', str(MAX_RECORDED_COMMANDS + 4)],
+             0,
+             MAX_RECORDED_COMMANDS + 4,
+             MAX_RECORDED_COMMANDS + 4])
+        self.assertEqual(slowest[-1][0][-1], '5')
+
+    def test_spans(self):
+        ctx = Mock()
+        current_ctx.set(ctx=ctx)
+        with operation_timer(ctx, 'start') as timer:
+            with timed('initialize'):
+                with timed('properties'):
+                    pass
+            with timed('deploy'):
+                record_command(['/usr/bin/serverless', 'deploy'], 0, 0.5, 3)
+            run_concurrently(
+                lambda index: record_command(
+                    ['serverless', 'invoke'], 1, 0.1, 0),
+                range(2))
+        spans = timer.trace()
+        by_name = {span['name']: span for span in spans}
+        self.assertEqual(spans[0]['kind'], 'operation')
+        self.assertIsNone(spans[0]['parent'])
+        self.assertEqual(
+            by_name['initialize']['parent'], timer.span_id)
+        self.assertEqual(
+            by_name['properties']['parent'], by_name['initialize']['id'])
+        self.assertEqual(
+            by_name['serverless deploy']['parent'], by_name['deploy']['id'])
+        self.assertEqual(
+            by_name['serverless deploy']['attributes'],
+            {'argv': ['serverless', 'deploy'],
+             'exit_code': 0,
+             'output_bytes': 3})
+        invokes = [span for span in spans
+                   if span['name'] == 'serverless invoke']
+        self.assertEqual(len(invokes), 2)
+        for span in invokes:
+            self.assertEqual(span['parent'], timer.span_id)
+        self.assertEqual(len({span['id'] for span in spans}), len(spans))
@@ -0,0 +1,95 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import unittest
+from tempfile import mkdtemp
+
+from .. import CloudifyServerlessSDKError
+from ..tracing import trace_path, write_trace
+
+SPANS = [
+    {
+        'id': 'a',
+        'parent': None,
+        'name': 'start',
+        'kind': 'operation',
+        'start': 1000.0,
+        'duration': 2.0,
+        'thread': 1,
+        'attributes': {},
+    },
+    {
+        'id': 'b',
+        'parent': 'a',
+        'name': 'serverless deploy',
+        'kind': 'command',
+        'start': 1000.5,
+        'duration': 1.25,
+        'thread': 1,
+        'attributes': {'exit_code': 0},
+    },
+]
+
+
+class TracingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_trace_path(self):
+        self.assertEqual(
+            trace_path(self.directory, 'dep', 'jsonl'),
+            os.path.join(self.directory, 'dep.jsonl'))
+        self.assertEqual(
+            trace_path(self.directory, 'dep', 'chrome'),
+            os.path.join(self.directory, 'dep.trace.json'))
+        self.assertRaises(
+            CloudifyServerlessSDKError,
+            trace_path, self.directory, 'dep', 'zipkin')
+
+    def test_jsonl(self):
+        path = trace_path(self.directory, 'dep', 'jsonl')
+        for node_instance in ['service_1', 'service_2']:
+            write_trace(path, 'jsonl', SPANS, 'dep', node_instance)
+        with open(path) as trace_file:
+            events = [json.loads(line) for line in trace_file]
+        self.assertEqual(len(events), 4)
+        self.assertEqual(events[1]['parent'], 'a')
+        self.assertEqual(events[1]['trace'], 'dep')
+        self.assertEqual(events[3]['node_instance'], 'service_2')
+
+    def test_chrome(self):
+        path = trace_path(self.directory, 'dep', 'chrome')
+        for node_instance in ['service_1', 'service_2']:
+            write_trace(path, 'chrome', SPANS, 'dep', node_instance)
+        with open(path) as trace_file:
+            content = trace_file.read()
+        # The array is left open, so close it to load it.
+        events = json.loads(content.rstrip().rstrip(',') + ']')
+        self.assertEqual(len(events), 6)
+        metadata = [event for event in events if event['ph'] == 'M']
+        self.assertEqual(
+            [event['args']['name'] for event in metadata],
+            ['service_1', 'service_2'])
+        self.assertNotEqual(metadata[0]['pid'], metadata[1]['pid'])
+        command = events[2]
+        self.assertEqual(command['ph'], 'X')
+        self.assertEqual(command['ts'], 1000500000)
+        self.assertEqual(command['dur'], 1250000)
+        self.assertEqual(command['args']['parent'], 'a')
+        self.assertEqual(command['args']['exit_code'], 0)
@@ -0,0 +1,169 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .locks import handed_locks, held_locks
+from .process import CloudifyServerlessProcessError
+from .utils import DEFAULT_MAX_CONCURRENCY, get_current_ctx, pushed_ctx
+
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_CAP = 30.0
+
+THROTTLING_PATTERN = re.compile(
+    r'TooManyRequestsException|ThrottlingException|Throttling|'
+    r'Rate exceeded|RequestLimitExceeded|Too Many Requests|SlowDown')
+
+
+def is_throttling_error(error):
+    """Tell if a failed CLI command was rejected by the provider's rate
+    limits, from its output.
+    """
+    if isinstance(error, CloudifyServerlessProcessError):
+        if error.timed_out:
+            return False
+        output = '\n'.join([error.stdout or '', error.stderr or ''])
+    else:
+        output = str(error)
+    return bool(THROTTLING_PATTERN.search(output))
+
+
+class Backoff(object):
+    """Exponential backoff with full jitter."""
+
+    def __init__(self, base=None, cap=None):
+        self.base = DEFAULT_BACKOFF_BASE if base is None else float(base)
+        self.cap = DEFAULT_BACKOFF_CAP if cap is None else float(cap)
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class AdaptiveLimiter(object):
+    """A semaphore whose limit follows an AIMD policy: it grows by one slot
+    for every limit's worth of successful calls, and halves when the
+    provider throttles. Throttling errors of calls that were started before
+    the last decrease do not decrease it again.
+    """
+
+    def __init__(self, maximum, minimum=1, initial=None, decrease=0.5):
+        self.maximum = max(1, int(maximum))
+        self.minimum = max(1, min(int(minimum), self.maximum))
+        self.limit = float(initial or self.maximum)
+        self.decrease = decrease
+        self.in_flight = 0
+        self.generation = 0
+        self._condition = threading.Condition()
+
+    @property
+    def slots(self):
+        return max(self.minimum, int(self.limit))
+
+    def acquire(self):
+        """Wait for a free slot.
+
+        :return: the generation to pass to on_throttle.
+        """
+        with self._condition:
+            while self.in_flight >= self.slots:
+                self._condition.wait()
+            self.in_flight += 1
+            return self.generation
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.slots)
+            self._condition.notify_all()
+
+    def on_throttle(self, generation):
+        with self._condition:
+            if generation != self.generation:
+                return
+            self.generation += 1
+            self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+def run_adaptively(func,
+                   items,
+                   max_concurrency=None,
+                   retries=None,
+                   backoff=None,
+                   logger=None):
+    """Like utils.run_concurrently, but calls that the provider throttles
+    are retried with backoff, and the concurrency adapts to the throttling.
+
+    :param func: a callable that receives a single item.
+    :param items: an iterable of items.
+    :param max_concurrency: the maximum number of concurrent calls.
+    :param retries: how many times to retry a throttled call.
+    :param backoff: a Backoff for the delays between retries.
+    :param logger: a logger for the retries.
+    :return: a list of (item, result, error) tuples in the order of items.
+    """
+    items = list(items)
+    if not items:
+        return []
+    max_concurrency = max(
+        1, min(int(max_concurrency or DEFAULT_MAX_CONCURRENCY), len(items)))
+    retries = DEFAULT_RETRIES if retries is None else int(retries)
+    backoff = backoff or Backoff()
+    limiter = AdaptiveLimiter(max_concurrency)
+    ctx = get_current_ctx()
+    # The calls may reenter the locks of the caller, which waits for them.
+    locks = held_locks()
+
+    def call(item):
+        with pushed_ctx(ctx), handed_locks(locks):
+            attempt = 0
+            while True:
+                generation = limiter.acquire()
+                try:
+                    result = func(item)
+                except Exception as error:
+                    if attempt >= retries or not is_throttling_error(error):
+                        raise
+                    limiter.on_throttle(generation)
+                else:
+                    limiter.on_success()
+                    return result
+                finally:
+                    limiter.release()
+                delay = backoff.delay(attempt)
+                attempt += 1
+                if logger:
+                    logger.info(
+                        'Throttled on {}, retry {} of {} in {:.1f} seconds '
+                        'with a concurrency of {}.'.format(
+                            item, attempt, retries, delay, limiter.slots))
+                time.sleep(delay)
+
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        futures = [pool.submit(call, item) for item in items]
+        for item, future in zip(items, futures):
+            try:
+                outcomes.append((item, future.result(), None))
+            except Exception as error:
+                outcomes.append((item, None, error))
+    return outcomes
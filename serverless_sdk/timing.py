@@ -0,0 +1,216 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import uuid
+import weakref
+import threading
+from contextlib import contextmanager
+
+from .utils import get_current_ctx
+
+# Only the slowest commands of an operation are kept in its record, the
+# others are only counted in the totals.
+MAX_RECORDED_COMMANDS = 20
+
+# The timer of every operation that is running, by its operation context.
+# Worker threads find it through the context that they get pushed.
+_timers = weakref.WeakKeyDictionary()
+
+
+def _span_id():
+    return uuid.uuid4().hex[:16]
+
+
+class OperationTimer(object):
+    """Collect how long the phases of one operation took, and the argv,
+    exit code, duration and output size of every command it ran.
+
+    Every phase and command is also kept as a span, whose parent is the
+    phase that was running on the same thread, or the operation.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.span_id = _span_id()
+        self.thread = threading.get_ident()
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.phases = {}
+        self.commands = []
+        self.command_count = 0
+        self.command_duration = 0.0
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _add_span(self, span_id, parent, name, kind, start, duration,
+                  attributes=None):
+        self.spans.append({
+            'id': span_id,
+            'parent': parent,
+            'name': name,
+            'kind': kind,
+            'start': start,
+            'duration': duration,
+            'thread': threading.get_ident(),
+            'attributes': attributes or {},
+        })
+
+    @contextmanager
+    def phase(self, phase):
+        """Time the block as phase, as a child span of the running phase.
+        """
+        stack = self._stack()
+        parent = stack[-1] if stack else self.span_id
+        span_id = _span_id()
+        stack.append(span_id)
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            with self._lock:
+                count, total = self.phases.get(phase, (0, 0.0))
+                self.phases[phase] = (count + 1, total + duration)
+                self._add_span(
+                    span_id, parent, phase, 'phase', started, duration)
+
+    def add_command(self, command, exit_code, duration, output_bytes):
+        argv = command.split() if isinstance(command, str) else list(command)
+        if argv:
+            argv[0] = os.path.basename(argv[0])
+        stack = self._stack()
+        with self._lock:
+            self.command_count += 1
+            self.command_duration += duration
+            self.commands.append((argv, exit_code, duration, output_bytes))
+            if len(self.commands) > MAX_RECORDED_COMMANDS:
+                self.commands.remove(
+                    min(self.commands, key=lambda entry: entry[2]))
+            self._add_span(
+                _span_id(),
+                stack[-1] if stack else self.span_id,
+                ' '.join(argv[:2]),
+                'command',
+                time.time() - duration,
+                duration,
+                {
+                    'argv': argv,
+                    'exit_code': exit_code,
+                    'output_bytes': output_bytes,
+                })
+
+    def stop(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+
+    def trace(self):
+        """The spans of the operation, the operation first."""
+        with self._lock:
+            spans = list(self.spans)
+        operation = {
+            'id': self.span_id,
+            'parent': None,
+            'name': self.operation,
+            'kind': 'operation',
+            'start': self.started,
+            'duration': self.duration,
+            'thread': self.thread,
+            'attributes': {},
+        }
+        return [operation] + sorted(spans, key=lambda span: span['start'])
+
+    def record(self):
+        """A compact, JSON serializable summary, with durations in
+        milliseconds.
+        """
+        with self._lock:
+            return {
+                'operation': self.operation,
+                'started': int(self.started),
+                'ms': _ms(self.duration),
+                'phases': {
+                    phase: [count, _ms(total)]
+                    for phase, (count, total) in self.phases.items()
+                },
+                'commands': {
+                    'count': self.command_count,
+                    'ms': _ms(self.command_duration),
+                    'slowest': [
+                        [argv, exit_code, _ms(duration), output_bytes]
+                        for argv, exit_code, duration, output_bytes
+                        in sorted(self.commands, key=lambda entry: -entry[2])
+                    ],
+                },
+            }
+
+
+def _ms(seconds):
+    return None if seconds is None else int(round(seconds * 1000))
+
+
+@contextmanager
+def operation_timer(ctx, operation):
+    """Time the operation that runs in ctx, until the block exits."""
+    timer = OperationTimer(operation)
+    try:
+        _timers[ctx] = timer
+    except TypeError:
+        # The context cannot be weakly referenced, nothing is timed.
+        ctx = None
+    try:
+        yield timer
+    finally:
+        timer.stop()
+        if ctx is not None:
+            _timers.pop(ctx, None)
+
+
+def current_timer():
+    ctx = get_current_ctx()
+    if ctx is None:
+        return None
+    try:
+        return _timers.get(ctx)
+    except TypeError:
+        return None
+
+
+@contextmanager
+def timed(phase):
+    """Add the time the block took to phase, in the timer of the running
+    operation, if there is one.
+    """
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    with timer.phase(phase):
+        yield
+
+
+def record_command(command, exit_code, duration, output_bytes):
+    timer = current_timer()
+    if timer is not None:
+        timer.add_command(command, exit_code, duration, output_bytes)
@@ -0,0 +1,94 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import zlib
+
+from . import CloudifyServerlessSDKError
+from .locks import file_lock
+
+JSONL = 'jsonl'
+CHROME = 'chrome'
+TRACE_SUFFIXES = {
+    JSONL: '.jsonl',
+    CHROME: '.trace.json',
+}
+
+
+def jsonl_events(spans, deployment, node_instance):
+    """One event per span, durations in seconds."""
+    for span in spans:
+        event = dict(span)
+        event['trace'] = deployment
+        event['node_instance'] = node_instance
+        yield event
+
+
+def chrome_events(spans, deployment, node_instance):
+    """Complete events of the Chrome trace event format, with every node
+    instance as a process, so that trace viewers show one track per node
+    instance.
+    """
+    pid = zlib.crc32(node_instance.encode('utf-8')) & 0x7fffffff
+    yield {
+        'name': 'process_name',
+        'ph': 'M',
+        'pid': pid,
+        'args': {'name': node_instance},
+    }
+    for span in spans:
+        args = dict(span['attributes'])
+        args.update(id=span['id'], parent=span['parent'], trace=deployment)
+        yield {
+            'name': span['name'],
+            'cat': span['kind'],
+            'ph': 'X',
+            'ts': int(span['start'] * 1000000),
+            'dur': int((span['duration'] or 0) * 1000000),
+            'pid': pid,
+            'tid': span['thread'],
+            'args': args,
+        }
+
+
+def trace_path(directory, deployment, trace_format):
+    if trace_format not in TRACE_SUFFIXES:
+        raise CloudifyServerlessSDKError(
+            'Unknown trace format {}, expected one of {}.'.format(
+                trace_format, ', '.join(sorted(TRACE_SUFFIXES))))
+    return os.path.join(
+        directory, '{}{}'.format(deployment, TRACE_SUFFIXES[trace_format]))
+
+
+def write_trace(path, trace_format, spans, deployment, node_instance):
+    """Append the spans of an operation to the trace file of a deployment.
+
+    Chrome trace files are JSON arrays that are never closed, which trace
+    viewers accept, so that every operation can append to them.
+    """
+    if trace_format == CHROME:
+        events = chrome_events(spans, deployment, node_instance)
+        separator = ',\n'
+    else:
+        events = jsonl_events(spans, deployment, node_instance)
+        separator = '\n'
+    lines = ''.join(
+        json.dumps(event, sort_keys=True) + separator for event in events)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with file_lock(path + '.lock'):
+        with open(path, 'a') as trace_file:
+            if trace_format == CHROME and not trace_file.tell():
+                trace_file.write('[\n')
+            trace_file.write(lines)
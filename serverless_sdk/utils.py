@@ -0,0 +1,114 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudify.state import current_ctx, NotInContext
+
+from .locks import handed_locks, held_locks
+
+DEFAULT_MAX_CONCURRENCY = 5
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_current_ctx():
+    try:
+        return current_ctx.get_ctx()
+    except NotInContext:
+        return None
+
+
+@contextmanager
+def pushed_ctx(ctx):
+    """The operation context is thread local, so worker threads need it
+    pushed explicitly before they can run CLI commands.
+    """
+    if ctx is None:
+        yield
+    else:
+        with current_ctx.push(ctx):
+            yield
+
+
+def run_concurrently(func, items, max_concurrency=None):
+    """Call func for every item on a bounded thread pool.
+
+    :param func: a callable that receives a single item.
+    :param items: an iterable of items.
+    :param max_concurrency: the maximum number of concurrent calls.
+    :return: a list of (item, result, error) tuples in the order of items.
+        A failed call does not stop the others, its error is returned.
+    """
+    items = list(items)
+    if not items:
+        return []
+    max_concurrency = max(
+        1, min(int(max_concurrency or DEFAULT_MAX_CONCURRENCY), len(items)))
+    ctx = get_current_ctx()
+    # The calls may reenter the locks of the caller, which waits for them.
+    locks = held_locks()
+
+    def call(item):
+        with pushed_ctx(ctx), handed_locks(locks):
+            return func(item)
+
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        futures = [pool.submit(call, item) for item in items]
+        for item, future in zip(items, futures):
+            try:
+                outcomes.append((item, future.result(), None))
+            except Exception as error:
+                outcomes.append((item, None, error))
+    return outcomes
+
+
+def sha256_file(file_path):
+    """Return the sha256 hex digest of a file, or None if it is missing."""
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except (IOError, OSError):
+        return None
+    return digest.hexdigest()
+
+
+def atomic_write(file_path, content):
+    """Replace file_path with content, so that readers see either the old
+    or the new file, and a crash never leaves a truncated file behind.
+    """
+    try:
+        mode = os.stat(file_path).st_mode & 0o777
+    except OSError:
+        mode = 0o644
+    handle, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(file_path),
+        prefix='.{}.'.format(os.path.basename(file_path)))
+    try:
+        with os.fdopen(handle, 'w') as outfile:
+            outfile.write(content)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, file_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,86 @@
+# Copyright (c) 2020 - 2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+from .timing import timed
+
+# yaml is imported on first use, see the import time test of the plugin.
+
+# libyaml emits printable ASCII exactly like the pure python emitter, but it
+# folds long double quoted scalars and emits some keys differently.
+PRINTABLE_ASCII = re.compile(r'^[\x20-\x7e]*$')
+MAX_SIMPLE_KEY_LENGTH = 128
+
+
+def loader(use_libyaml=True):
+    """Return the libyaml based safe loader if it is available,
+    otherwise the pure python one.
+    """
+    import yaml
+    if use_libyaml:
+        return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.SafeLoader
+
+
+def dumper(use_libyaml=True):
+    """Return the libyaml based safe dumper if it is available,
+    otherwise the pure python one.
+    """
+    import yaml
+    if use_libyaml:
+        return getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+    return yaml.SafeDumper
+
+
+def safe_load(stream, use_libyaml=True):
+    import yaml
+    if isinstance(stream, str):
+        # libyaml only reads exact str, not the ProcessOutput of commands.
+        stream = str(stream)
+    with timed('yaml_load'):
+        return yaml.load(stream, Loader=loader(use_libyaml))
+
+
+def emits_identically(data):
+    """Check that libyaml dumps data exactly like the pure python dumper.
+    """
+    if isinstance(data, str):
+        return bool(PRINTABLE_ASCII.match(data))
+    if data is None or isinstance(data, (bool, int, float)):
+        return True
+    if isinstance(data, (list, tuple)):
+        return all(emits_identically(item) for item in data)
+    if isinstance(data, dict):
+        return all(
+            (not isinstance(key, str) or
+             0 < len(key) < MAX_SIMPLE_KEY_LENGTH) and
+            emits_identically(key) and emits_identically(value)
+            for key, value in data.items())
+    return False
+
+
+def safe_dump(data, stream=None, use_libyaml=True, **kwargs):
+    """Dump with libyaml when it is available and it is known to emit the
+    same output as the pure python dumper for data.
+    """
+    import yaml
+    with timed('yaml_dump'):
+        use_libyaml = use_libyaml and emits_identically(data)
+        return yaml.dump(data, stream, Dumper=dumper(use_libyaml), **kwargs)
+
+
+def yaml_error():
+    import yaml
+    return yaml.YAMLError